@@ -1,21 +1,19 @@
 """
 A collection of agents to play the game
 """
+import time
 import numpy as np
-import anthropic
 
-from game import Guesser, Spymaster
+from game import Guesser, Spymaster, COLORS
+import backends
 import constants
+import metrics
+import scheduler
 
-def get_anthropic_answer(client, system_prompt, message):
-    response = client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=1024,
-            temperature=0.0,
-            system=system_prompt,
-            messages=[{"role": "user", "content": [{"type": "text", "text": message}]}]
-        )
-    response_str = response.content[0].text
+MODEL = backends.DEFAULT_MODEL
+
+def parse_answer(response_str):
+    """Returns (found_response, text between the <response> tags, full response)."""
     found_response = False
     tag_loc = response_str.find("<response>")
     response_returned = "No word found in response"
@@ -24,6 +22,56 @@ def get_anthropic_answer(client, system_prompt, message):
         response_returned = response_str[tag_loc + 10: response_str.find("</response>")]
     return found_response, response_returned, response_str
 
+def get_anthropic_answer(backend, system_prompt, message, cache=None, prefix=""):
+    """
+    Args:
+        backend: LLMBackend, or an anthropic client to call directly.
+        cache: ResponseCache or None. Responses are looked up in and stored to the cache, which is
+            safe because we always sample at temperature 0.
+        prefix: str, start of the message that is the same across calls, sent for prompt caching.
+    """
+    backend = backends.as_backend(backend)
+    start_time = time.perf_counter()
+    completion = response_str = None
+    if cache is not None:
+        response_str = cache.get(backend.model, system_prompt, prefix + message)
+    if response_str is None:
+        completion = backend.complete(system_prompt, message, prefix)
+        response_str = completion.text
+        if cache is not None:
+            cache.put(backend.model, system_prompt, prefix + message, response_str)
+    answer = parse_answer(response_str)
+    metrics.record_llm_call(start_time, completion, answer[0])
+    return answer
+
+async def get_anthropic_answer_async(backend, system_prompt, message, cache=None, prefix=""):
+    """Same as get_anthropic_answer but awaits the backend, or an anthropic.AsyncAnthropic client."""
+    backend = backends.as_backend(backend, is_async=True)
+    start_time = time.perf_counter()
+    completion = response_str = None
+    if cache is not None:
+        response_str = cache.get(backend.model, system_prompt, prefix + message)
+    if response_str is None:
+        completion = await backend.complete_async(system_prompt, message, prefix)
+        response_str = completion.text
+        if cache is not None:
+            cache.put(backend.model, system_prompt, prefix + message, response_str)
+    answer = parse_answer(response_str)
+    metrics.record_llm_call(start_time, completion, answer[0])
+    return answer
+
+def encode_board(state):
+    """Compact board for prompts: the words left to guess, then the guessed words with their colors."""
+    unguessed = [word for word in state.words if word not in state.revealed]
+    lines = [f"Unguessed: {', '.join(unguessed)}"]
+    if state.revealed:
+        lines.append(f"Guessed: {', '.join(f'{word} ({color})' for word, color in state.revealed.items())}")
+    return "\n".join(lines)
+
+def encode_code(state):
+    """Every word grouped by its color. It doesn't change during a game, so it is sent as a cached prefix."""
+    return "\n".join(f"{color}: {', '.join(word for word in state.words if state.code[word] == color)}" for color in COLORS)
+
 class RandomGuesser(Guesser):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -44,19 +92,20 @@ class RandomSpymaster(Spymaster):
             random_words.append("".join(np.random.choice(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"), 5)))
         for word in random_words:
             if word not in state.words:
-                return word, ""
+                return word, 1
         assert False, "No valid clue givable. Something wrong."
 
 class AISpymaster(Spymaster):
-    def __init__(self, extra_prompt="", verbose=False, include_guesser_thoughts=False):
+    def __init__(self, extra_prompt="", verbose=False, include_guesser_thoughts=False, cache=None, backend=None):
         super().__init__()
         self.system_prompt = """
-        You are the spymaster in codeNames. Among the words that haven't been guessed (i.e. don't have a color next to them), think about which words can be related via a clue word. You can keep it simple and have the clue correspond to 1 word, or relate 2 words, or even 3 or 4 words. Give a final clue in this format: <response>Word,2</response>. The response should be the word and the number of words to guess with the tags around the answer.
+        You are the spymaster in codeNames. You are given every word on the board grouped by color, then the words that haven't been guessed yet. Among the unguessed words, think about which words can be related via a clue word. You can keep it simple and have the clue correspond to 1 word, or relate 2 words, or even 3 or 4 words. Give a final clue in this format: <response>Word,2</response>. The response should be the word and the number of words to guess with the tags around the answer.
         """
-        self.client = anthropic.Anthropic()
+        self.backend = backend if backend is not None else scheduler.shared()
         self.verbose = verbose
         self.system_prompt += extra_prompt
         self.include_guesser_thoughts = include_guesser_thoughts
+        self.cache = cache
     
     def get_rolled_back_info(self, state):
         msg = ""
@@ -77,9 +126,13 @@ class AISpymaster(Spymaster):
                 msg += f"\nA guess was wrong when clue {clue_w} was given for {clue_n} words."
         return msg
 
-    def get_move(self, state):
-        message = f"Board as the guesser sees it:\n{state.board}\n-------\nBoard with code: {state.board_with_code}\nYou on are on team {state.curr_team}"
-        if self.include_guesser_thoughts and state.guesser_thoughts != []:
+    def get_prefix(self, state):
+        return f"Board with code:\n{encode_code(state)}\n-------\n"
+
+    def get_message(self, state):
+        """Returns the part of the message that changes during the game, which follows get_prefix."""
+        message = f"Board as the guesser sees it:\n{encode_board(state)}\nYou on are on team {state.curr_team}"
+        if self.include_guesser_thoughts and state.guesser_thoughts:
             message += f"\nGuesser's thoughts from this game have been: {state.guesser_thoughts}"
         if state.game_response != "":
             message += f"\n{state.game_response}"
@@ -87,34 +140,90 @@ class AISpymaster(Spymaster):
             message += "\nWe simulated a version of yourself one or more times already. Here is the log of those previous simulated attempts:\n"
             message += self.get_rolled_back_info(state)
             message += "\nIf a simulation was good, you should give that clue again since last time it was just a simulation and this time is for real. Otherwise, consider revising either the clue word or the clue number and give a new clue."
+        rank = getattr(state, "rollout_rank", 0)
+        if rank:
+            message += ("\nOther simulations are being run at the same time. So they don't all try the same clue, "
+                        f"give the clue you rank number {rank + 1} instead of your best one.")
         if self.verbose:
             print("🕵️ Message to spymaster:")
-            print(message)
+            print(self.get_prefix(state) + message)
             print("🕵️-*- over.")
         assert isinstance(message, str)
         assert isinstance(self.system_prompt, str)
-        success, response, thoughts = get_anthropic_answer(self.client, self.system_prompt, message)
+        return message
+
+    def parse_move(self, response):
         if self.verbose:
             print("🕵️ Response from spymaster:")
             print(response)
             print("🕵️-*- over.")
         return response.split(",")
 
+    def get_move(self, state):
+        success, response, thoughts = get_anthropic_answer(self.backend, self.system_prompt, self.get_message(state),
+                                                           cache=self.cache, prefix=self.get_prefix(state))
+        return self.parse_move(response)
+
+    async def get_move_async(self, state):
+        success, response, thoughts = await get_anthropic_answer_async(self.backend, self.system_prompt, self.get_message(state),
+                                                                       cache=self.cache, prefix=self.get_prefix(state))
+        return self.parse_move(response)
+
 
 class AIGuesser(Guesser):
-    def __init__(self, extra_prompt=""):
+    def __init__(self, extra_prompt="", cache=None, backend=None, ranked=False):
+        """
+        Args:
+            ranked: bool, whether to ask for all of a clue's guesses in one call, best first, instead
+                of one call per guess. The game plays them in order until one is wrong.
+        """
         super().__init__()
         self.system_prompt = """
-        You are the guesser in codeNames. Look at the board. Words with a color next to them have already been guessed, and can be ignored. Use the clue word to figure out which word is related. After thinking, write your guess as <response>Word</response>. The response should be the word with the tags around the answer. Do not include the tags around anything other than your answer.
+        You are the guesser in codeNames. Look at the board. Only the unguessed words can be picked; guessed words are listed with their color and can be ignored. Use the clue word to figure out which word is related. After thinking, write your guess as <response>Word</response>. The response should be the word with the tags around the answer. Do not include the tags around anything other than your answer.
         """
-        self.client = anthropic.Anthropic()
+        if ranked:
+            self.system_prompt += """
+        When asked for a list of guesses, write them from most to least confident as <response>Word,Word</response>. They are played in order until one is wrong, so stop the list when you are no longer confident.
+        """
+        self.backend = backend if backend is not None else scheduler.shared()
         self.system_prompt += extra_prompt
+        self.cache = cache
+        self.ranks_guesses = ranked
 
-    def get_move(self, state):
-        message = f"Board:{state.board}\nYou were given the clue word: {state.clues[-1][0]} for {state.clues[-1][1]} words."
+    def get_message(self, state, n=None):
+        """n is the number of guesses to ask for, or None for a single guess."""
+        message = f"Board:\n{encode_board(state)}\nYou were given the clue word: {state.clues[-1][0]} for {state.clues[-1][1]} words."
+        if n is not None:
+            message += f"\nList up to {n} guesses."
         if state.game_response != "":
             message += f"\n{state.game_response}"
         assert isinstance(message, str)
         assert isinstance(self.system_prompt, str)
-        success, response, thoughts = get_anthropic_answer(self.client, self.system_prompt, message)
+        return message
+
+    def parse_ranked_moves(self, answer, n):
+        success, response, thoughts = answer
+        if not success:
+            return [(response, thoughts)]
+        guesses = [word.strip() for word in response.split(",") if word.strip()][:n]
+        # a shorter list means the guesser wants to stop after it
+        if len(guesses) < n:
+            guesses.append(constants.END_OF_TURN)
+        # the thoughts are stored with the first guess only, so they aren't repeated for every guess
+        return [(guess, thoughts if i == 0 else "") for i, guess in enumerate(guesses)]
+
+    def get_ranked_moves(self, state, n):
+        answer = get_anthropic_answer(self.backend, self.system_prompt, self.get_message(state, n), cache=self.cache)
+        return self.parse_ranked_moves(answer, n)
+
+    async def get_ranked_moves_async(self, state, n):
+        answer = await get_anthropic_answer_async(self.backend, self.system_prompt, self.get_message(state, n), cache=self.cache)
+        return self.parse_ranked_moves(answer, n)
+
+    def get_move(self, state):
+        success, response, thoughts = get_anthropic_answer(self.backend, self.system_prompt, self.get_message(state), cache=self.cache)
+        return response, thoughts
+
+    async def get_move_async(self, state):
+        success, response, thoughts = await get_anthropic_answer_async(self.backend, self.system_prompt, self.get_message(state), cache=self.cache)
         return response, thoughts
\ No newline at end of file
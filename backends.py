@@ -0,0 +1,187 @@
+"""
+Pluggable model backends for the AI agents.
+
+An LLMBackend turns a system prompt and a user message into a Completion. The message may start
+with a prefix that stays the same across many calls, like the board with its code, which is sent
+as its own block so AnthropicBackend can mark it, and the system prompt, for prompt caching.
+AnthropicBackend calls
+the real API, or anything speaking its protocol like mock_server.MockServer. TraceBackend answers
+from a JSONL file of recorded calls, which RecordingBackend writes while wrapping another backend.
+"""
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import cache
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20240620"
+# agents put their answer in <response> tags, so nothing after this is needed
+STOP_AT = "</response>"
+
+# input_tokens doesn't include the cached tokens, which are billed apart
+Usage = namedtuple("Usage", ["input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"],
+                   defaults=(0, 0))
+# api_retries is how many times a Scheduler retried the call before it went through
+Completion = namedtuple("Completion", ["text", "usage", "api_retries"], defaults=(0,))
+
+
+class LLMBackend(ABC):
+    model = DEFAULT_MODEL
+
+    @abstractmethod
+    def complete(self, system_prompt, message, prefix="") -> Completion:
+        """The model sees prefix + message as the user message."""
+        raise NotImplementedError()
+
+    async def complete_async(self, system_prompt, message, prefix="") -> Completion:
+        """By default runs complete in a worker thread so the event loop isn't blocked."""
+        return await asyncio.to_thread(self.complete, system_prompt, message, prefix)
+
+
+def text_block(text, cached=False):
+    block = {"type": "text", "text": text}
+    if cached:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def request_kwargs(model, system_prompt, message, prefix=""):
+    """The system prompt and the prefix end cache breakpoints, so calls sharing them only pay
+    full price for message. Prefixes under the model's minimum cacheable length are just sent as is."""
+    content = [text_block(prefix, cached=True)] if prefix else []
+    content.append(text_block(message))
+    return dict(
+            model=model,
+            max_tokens=1024,
+            temperature=0.0,
+            system=[text_block(system_prompt, cached=True)],
+            messages=[{"role": "user", "content": content}]
+        )
+
+
+def to_usage(usage):
+    return Usage(*[getattr(usage, field, 0) or 0 for field in Usage._fields])
+
+
+def to_completion(response):
+    return Completion(response.content[0].text, to_usage(getattr(response, "usage", None)))
+
+
+def cut_at(text, stop_at):
+    """Returns text up to and including the first stop_at, or None if it isn't in text yet."""
+    end = text.find(stop_at)
+    return None if end == -1 else text[:end + len(stop_at)]
+
+
+class AnthropicBackend(LLMBackend):
+    def __init__(self, model=DEFAULT_MODEL, client=None, async_client=None, stop_at=None, **client_kwargs):
+        """
+        Args:
+            client, async_client: anthropic.Anthropic and anthropic.AsyncAnthropic style clients. Each
+                is built from client_kwargs (e.g. base_url, api_key) the first time it is needed.
+            stop_at: str, if given answers are streamed, and the stream is closed as soon as stop_at
+                has arrived instead of waiting for the text the model writes after it.
+        """
+        self.model = model
+        self._client = client
+        self._async_client = async_client
+        self.stop_at = stop_at
+        self.client_kwargs = client_kwargs
+
+    @property
+    def client(self):
+        if self._client is None:
+            import anthropic # only loaded once a model is really called
+            self._client = anthropic.Anthropic(**self.client_kwargs)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            import anthropic
+            self._async_client = anthropic.AsyncAnthropic(**self.client_kwargs)
+        return self._async_client
+
+    def complete(self, system_prompt, message, prefix=""):
+        kwargs = request_kwargs(self.model, system_prompt, message, prefix)
+        if self.stop_at is None:
+            return to_completion(self.client.messages.create(**kwargs))
+        text = ""
+        # leaving the with block closes the connection, which cancels the rest of the answer
+        with self.client.messages.stream(**kwargs) as stream:
+            for chunk in stream.text_stream:
+                text += chunk
+                if cut_at(text, self.stop_at) is not None:
+                    break
+            # if the stream was closed early, output_tokens only counts what the server reported so far
+            return Completion(cut_at(text, self.stop_at) or text, to_usage(stream.current_message_snapshot.usage))
+
+    async def complete_async(self, system_prompt, message, prefix=""):
+        kwargs = request_kwargs(self.model, system_prompt, message, prefix)
+        if self.stop_at is None:
+            return to_completion(await self.async_client.messages.create(**kwargs))
+        text = ""
+        async with self.async_client.messages.stream(**kwargs) as stream:
+            async for chunk in stream.text_stream:
+                text += chunk
+                if cut_at(text, self.stop_at) is not None:
+                    break
+            return Completion(cut_at(text, self.stop_at) or text, to_usage(stream.current_message_snapshot.usage))
+
+
+class TraceBackend(LLMBackend):
+    def __init__(self, path, model=DEFAULT_MODEL):
+        """Answers from a JSONL trace written by RecordingBackend. Raises KeyError for unrecorded calls."""
+        self.model = model
+        self.traces = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                trace = json.loads(line)
+                message = trace.get("prefix", "") + trace["message"]
+                key = cache.make_key(trace["model"], trace["system"], message)
+                self.traces[key] = Completion(trace["response"], Usage(*trace["usage"]))
+
+    def complete(self, system_prompt, message, prefix=""):
+        key = cache.make_key(self.model, system_prompt, prefix + message)
+        if key not in self.traces:
+            raise KeyError(f"No recorded response for this prompt (key {key})")
+        return self.traces[key]
+
+    async def complete_async(self, system_prompt, message, prefix=""):
+        return self.complete(system_prompt, message, prefix)
+
+
+class RecordingBackend(LLMBackend):
+    def __init__(self, backend, path):
+        """Passes calls through to backend and appends each one to the JSONL trace at path."""
+        self.backend = backend
+        self.model = backend.model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write(self, system_prompt, message, prefix, completion):
+        trace = {"model": self.model, "system": system_prompt, "prefix": prefix, "message": message,
+                 "response": completion.text, "usage": list(completion.usage)}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace) + "\n")
+
+    def complete(self, system_prompt, message, prefix=""):
+        completion = self.backend.complete(system_prompt, message, prefix)
+        self._write(system_prompt, message, prefix, completion)
+        return completion
+
+    async def complete_async(self, system_prompt, message, prefix=""):
+        completion = await self.backend.complete_async(system_prompt, message, prefix)
+        self._write(system_prompt, message, prefix, completion)
+        return completion
+
+
+def as_backend(backend_or_client, is_async=False):
+    """Lets callers pass a bare anthropic client, sync or async, wherever a backend is expected."""
+    if isinstance(backend_or_client, LLMBackend):
+        return backend_or_client
+    if is_async:
+        return AnthropicBackend(async_client=backend_or_client)
+    return AnthropicBackend(client=backend_or_client)
@@ -0,0 +1,161 @@
+"""
+Plays many AI games at once through the Message Batches API, for offline evaluations like prompt
+comparisons where cost and throughput matter more than latency.
+
+Every game runs as an asyncio task whose agents share a BatchBackend. Once every unfinished game
+is waiting on a model call, all of the waiting calls go out as one batch, and each game resumes
+with its answer when the batch has ended. So a cycle advances every game by one move, and
+thousands of games cost one batch per move instead of one call each. Point the backend at
+mock_server.MockServer (base_url=server.url) to run it offline.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import time
+
+import agents
+import backends
+import game
+import gamelog
+import tournament
+
+
+class BatchRequestError(Exception):
+    pass
+
+
+class BatchBackend(backends.LLMBackend):
+    def __init__(self, model=backends.DEFAULT_MODEL, client=None, poll_interval=10.0, max_batch_size=100_000,
+                 max_retries=3, **client_kwargs):
+        """
+        Args:
+            client: anthropic.AsyncAnthropic style client, built from client_kwargs if None.
+            poll_interval: float, seconds between checks on whether a batch has ended.
+            max_batch_size: int, most requests sent in one batch. The API allows 100,000.
+            max_retries: int, times a request that errored or expired is put in the next batch.
+        """
+        self.model = model
+        self._client = client
+        self.client_kwargs = client_kwargs
+        self.poll_interval = poll_interval
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.pending = [] # (custom_id, request params, future, tries)
+        self.n_batches = 0
+        self.n_requests = 0
+        self._ids = itertools.count()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import anthropic
+            self._client = anthropic.AsyncAnthropic(**self.client_kwargs)
+        return self._client
+
+    def complete(self, system_prompt, message, prefix=""):
+        raise NotImplementedError("BatchBackend answers calls a batch at a time, use it from play_games.")
+
+    async def complete_async(self, system_prompt, message, prefix=""):
+        future = asyncio.get_running_loop().create_future()
+        params = backends.request_kwargs(self.model, system_prompt, message, prefix)
+        self.pending.append((f"call-{next(self._ids)}", params, future, 0))
+        return await future
+
+    async def submit(self):
+        """Sends the pending calls as one batch, waits for it to end and resolves each call's future."""
+        batch_calls, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+        requests = [{"custom_id": custom_id, "params": params} for custom_id, params, _, _ in batch_calls]
+        batch = await self.client.messages.batches.create(requests=requests)
+        while batch.processing_status != "ended":
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+        self.n_batches += 1
+        self.n_requests += len(batch_calls)
+
+        calls = {call[0]: call for call in batch_calls}
+        # results come back in any order, so they are matched to calls by custom_id
+        async for entry in await self.client.messages.batches.results(batch.id):
+            custom_id, params, future, tries = calls.pop(entry.custom_id)
+            if entry.result.type == "succeeded":
+                future.set_result(backends.to_completion(entry.result.message))
+            elif tries < self.max_retries:
+                self.pending.append((custom_id, params, future, tries + 1))
+            else:
+                future.set_exception(BatchRequestError(f"Request {custom_id} {entry.result.type} {tries + 1} times"))
+        for custom_id, _, future, _ in calls.values():
+            future.set_exception(BatchRequestError(f"No result for request {custom_id}"))
+
+
+async def play_games_async(games, guesser, spymaster, backend, max_turns=25):
+    """
+    Plays games to the end, submitting a batch whenever every unfinished game waits on backend.
+    Each game must make one call at a time, which holds for Game.play_async.
+    Returns:
+        list of winners, one per game.
+    """
+    tasks = [asyncio.create_task(a_game.play_async(guesser, spymaster, max_turns=max_turns)) for a_game in games]
+    while True:
+        running = [task for task in tasks if not task.done()]
+        if not running:
+            break
+        if len(backend.pending) >= len(running):
+            await backend.submit()
+        else:
+            # let the games that have an answer play on until they need the next one
+            await asyncio.sleep(0)
+    return [task.result() for task in tasks]
+
+
+def play_games(seeds, backend, guesser_prompt="", spymaster_prompt="", board_fn=tournament.default_board, max_turns=25,
+               log=None):
+    """
+    Plays one AI vs AI game per seed through backend.
+    Args:
+        log: gamelog.Writer that every game is written to, if not None.
+    Returns:
+        list of result dicts like tournament.play_game, one per seed.
+    """
+    guesser = agents.AIGuesser(extra_prompt=guesser_prompt, backend=backend)
+    spymaster = agents.AISpymaster(extra_prompt=spymaster_prompt, backend=backend)
+    games = []
+    for seed in seeds:
+        word_list, code = board_fn(seed)
+        a_game = game.Game(word_list, code=code, seed=seed)
+        a_game.verbose = False
+        if log is not None:
+            log.attach(a_game)
+        games.append(a_game)
+    start = time.perf_counter()
+    # the games print every round, which would flood the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        winners = asyncio.run(play_games_async(games, guesser, spymaster, backend, max_turns))
+    seconds = time.perf_counter() - start
+    return [{"seed": seed, "winner": winner, "turns": a_game.turns, "seconds": seconds}
+            for seed, winner, a_game in zip(seeds, winners, games)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_boards", type=int, default=100)
+    parser.add_argument("--first_seed", type=int, default=0)
+    parser.add_argument("--base_url", type=str, default=None, help="e.g. the url of python mock_server.py")
+    parser.add_argument("--poll_interval", type=float, default=10.0)
+    parser.add_argument("--guesser_prompt", type=str, default="")
+    parser.add_argument("--spymaster_prompt", type=str, default="")
+    parser.add_argument("--log_path", type=str, default=None, help="game log to append the games to, see gamelog.py")
+    args = parser.parse_args()
+    client_kwargs = {"base_url": args.base_url} if args.base_url else {}
+    backend = BatchBackend(poll_interval=args.poll_interval, **client_kwargs)
+    seeds = list(range(args.first_seed, args.first_seed + args.n_boards))
+    log = gamelog.Writer(args.log_path) if args.log_path else None
+    results = play_games(seeds, backend, args.guesser_prompt, args.spymaster_prompt, log=log)
+    if log is not None:
+        log.close()
+    print(tournament.summarize(results))
+    print(f"{backend.n_requests} requests in {backend.n_batches} batches")
+
+
+if __name__ == "__main__":
+    main()
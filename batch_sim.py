@@ -0,0 +1,174 @@
+"""
+A vectorized simulator for the baseline agents.
+
+Instead of a Game object per board, B boards are held as integer arrays: a color code per card, a
+bitmask of guessed cards and the team to play. Every step resolves one guess on all unfinished
+boards at once. RandomSpymaster always clues 1 word, so a round of the baseline agents is exactly
+one guess, which is what a step plays.
+"""
+import random
+
+import numpy as np
+
+import constants
+import rules
+import words
+from rules import BLUE, RED, ASSASIN
+
+NO_WINNER = -1
+COLOR_CODES = rules.COLOR_IDS
+TEAMS = list(rules.TEAMS)
+
+
+def code_order(board_size=constants.N_CARDS, config=None):
+    """Color codes of the words in the order generate_code assigns them, before Game shuffles."""
+    if config is None:
+        config = rules.BoardConfig(board_size)
+    return np.repeat(np.arange(len(rules.COLORS), dtype=np.int8), rules.color_counts(config))
+
+
+def colors_from_seeds(seeds, board_size=constants.N_CARDS):
+    """
+    Returns the (B, board_size) colors of the boards Game(words.main(board_size, seed), seed=seed)
+    plays. The colors only depend on the shuffle, which only depends on the seed, so the words
+    don't have to be loaded.
+    """
+    order = code_order(board_size)
+    colors = np.empty((len(seeds), board_size), dtype=np.int8)
+    permutation = list(range(board_size))
+    for i, seed in enumerate(seeds):
+        random.Random(seed).shuffle(permutation)
+        colors[i] = order[permutation]
+        permutation.sort()
+    return colors
+
+
+def unguessable_from_seeds(seeds, board_size=constants.N_CARDS):
+    """
+    Returns a (B, board_size) bool mask of the cards Game.guess_word rejects. guess_word turns the
+    guess into "First rest" casing, so a word like "Ice Cream" never matches the board.
+    """
+    mask = np.zeros((len(seeds), board_size), dtype=bool)
+    for i, seed in enumerate(seeds):
+        word_list = list(words.main(board_size, seed=seed))
+        random.Random(seed).shuffle(word_list)
+        mask[i] = [word != word[0].upper() + word[1:].lower() for word in word_list]
+    return mask
+
+
+def random_colors(n_boards, rng, board_size=constants.N_CARDS):
+    """Returns (n_boards, board_size) colors of uniformly shuffled boards."""
+    permutations = rng.random((n_boards, board_size)).argsort(axis=1)
+    return code_order(board_size)[permutations]
+
+
+class BatchGames():
+    def __init__(self, colors, unguessable=None, win_thresholds=None):
+        """
+        Args:
+            colors: (B, n_cards) int array of color codes, in the order the guesser sees the board.
+            unguessable: (B, n_cards) bool array of cards whose guess is rejected, or None.
+            win_thresholds: (blue, red) number of revealed cards that wins the game. Defaults to
+                all of the team's cards on each board, like rules.winner.
+        """
+        self.colors = np.asarray(colors, dtype=np.int8)
+        self.n_boards, self.n_cards = self.colors.shape
+        assert self.n_cards <= 64, "Guessed bitmask holds at most 64 cards"
+        if unguessable is None:
+            unguessable = np.zeros(self.colors.shape, dtype=bool)
+        self.unguessable = unguessable
+        if win_thresholds is None:
+            win_thresholds = np.stack([(self.colors == BLUE).sum(axis=1), (self.colors == RED).sum(axis=1)], axis=1)
+        self.win_thresholds = np.broadcast_to(np.asarray(win_thresholds), (self.n_boards, 2))
+
+        self.guessed = np.zeros(self.n_boards, dtype=np.uint64)
+        self.curr_team = np.full(self.n_boards, BLUE, dtype=np.int8)
+        self.score = np.zeros((self.n_boards, 2), dtype=np.int16)
+        self.winner = np.full(self.n_boards, NO_WINNER, dtype=np.int8)
+        self.active = np.ones(self.n_boards, dtype=bool)
+        self.turns = np.zeros(self.n_boards, dtype=np.int16)
+
+    @classmethod
+    def from_seeds(cls, seeds, check_words=False, **kwargs):
+        """Boards matching Game.play for each seed. check_words loads the words to mark the cards
+        guess_word rejects, which is needed for an exact match but is much slower."""
+        unguessable = unguessable_from_seeds(seeds) if check_words else None
+        return cls(colors_from_seeds(seeds), unguessable=unguessable, **kwargs)
+
+    def guessed_mask(self, idx=slice(None)):
+        """Returns the guessed bitmask of the given boards unpacked into a (B, n_cards) bool array."""
+        bits = np.uint64(1) << np.arange(self.n_cards, dtype=np.uint64)
+        return (self.guessed[idx, None] & bits) != 0
+
+    def first_unguessed(self, idx):
+        """Index of the lowest unguessed card on the given boards, which is RandomGuesser's guess."""
+        free = ~self.guessed[idx]
+        lowest_bit = free & (~free + np.uint64(1))
+        return np.log2(lowest_bit.astype(np.float64)).astype(np.int64)
+
+    def random_unguessed(self, idx, rng):
+        keys = rng.random((len(idx), self.n_cards))
+        keys[self.guessed_mask(idx)] = -1.0
+        return keys.argmax(axis=1)
+
+    def step(self, policy="in_order", rng=None):
+        """Plays one round, a single guess, on every unfinished board."""
+        idx = np.flatnonzero(self.active)
+        if len(idx) == 0:
+            return
+        if policy == "in_order":
+            cards = self.first_unguessed(idx)
+        elif policy == "random":
+            cards = self.random_unguessed(idx, rng)
+        else:
+            raise ValueError(f"Unknown policy {policy}")
+        team = self.curr_team[idx]
+
+        # RandomGuesser repeats a rejected guess every round, so the game can only run out of turns
+        stuck = self.unguessable[idx, cards]
+        self.active[idx[stuck]] = False
+        idx, cards, team = idx[~stuck], cards[~stuck], team[~stuck]
+
+        colors = self.colors[idx, cards]
+        self.guessed[idx] |= np.uint64(1) << cards.astype(np.uint64)
+        for color in (BLUE, RED):
+            self.score[idx[colors == color], color] += 1
+
+        assassin = colors == ASSASIN
+        self.winner[idx[assassin]] = 1 - team[assassin]
+        for color in (BLUE, RED):
+            won = ~assassin & (self.score[idx, color] == self.win_thresholds[idx, color])
+            self.winner[idx[won]] = color
+        finished = self.winner[idx] != NO_WINNER
+        self.active[idx[finished]] = False
+        going_on = idx[~finished]
+        self.turns[going_on] += 1
+        self.curr_team[going_on] = 1 - self.curr_team[going_on]
+
+    def run(self, max_turns=25, policy="in_order", rng=None):
+        """Plays every board to the end. Returns the (B,) winners, NO_WINNER if the turns ran out."""
+        for _ in range(max_turns):
+            if not self.active.any():
+                break
+            self.step(policy=policy, rng=rng)
+        return self.winner
+
+
+def win_stats(winners):
+    """Counts winners in the same format as tournament.summarize, None for no winner."""
+    return {"BLUE": int((winners == BLUE).sum()), "RED": int((winners == RED).sum()),
+            None: int((winners == NO_WINNER).sum())}
+
+
+def simulate(n_boards, seed=0, policy="in_order", max_turns=25):
+    """Plays n_boards random boards and returns the win stats."""
+    rng = np.random.default_rng(seed)
+    batch = BatchGames(random_colors(n_boards, rng))
+    return win_stats(batch.run(max_turns=max_turns, policy=policy, rng=rng))
+
+
+if __name__ == "__main__":
+    import time
+    start = time.perf_counter()
+    stats = simulate(1_000_000)
+    print(f"win stats: {stats} in {time.perf_counter() - start:.2f}s")
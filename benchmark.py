@@ -0,0 +1,167 @@
+"""
+Throughput benchmarks for the game engine and agents.
+
+Run `python benchmark.py --save` once to write a baseline, then `python benchmark.py` to compare
+against it. The run fails if any benchmark is more than --threshold slower than its baseline.
+The AI agent benchmarks talk to a local mock_server, so no API key or network is needed.
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import agents
+import backends
+import game
+import mock_server
+import words
+
+BASELINE_PATH = "benchmark_baseline.json"
+BOARD = ["Cook", "Glass", "Ruler", "Phoenix", "Thief", "Force", "Lab", "Pilot", "Vacuum", "Buck", "Boom",
+         "Spell", "Death", "Robot", "Laser", "Note", "Circle", "Web", "Ambulance", "Lock", "Key", "Octopus",
+         "Pyramid", "Plastic", "Hospital"]
+# the engine and the baseline agents must import within this, without any of HEAVY_MODULES
+ENGINE_MODULES = ("game", "agents")
+IMPORT_BUDGET_SECONDS = 0.5
+HEAVY_MODULES = ("anthropic", "tkinter", "tabulate", "colorama")
+
+
+def measure(fn, min_seconds=0.5, repeats=3):
+    """Returns the best calls per second of fn over repeats runs of at least min_seconds each."""
+    best = 0.0
+    for _ in range(repeats):
+        n_calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            n_calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        best = max(best, n_calls / elapsed)
+    return best
+
+
+def new_game(seed=0):
+    a_game = game.Game(list(BOARD), seed=seed)
+    a_game.verbose = False
+    return a_game
+
+
+def engine_benchmarks():
+    """Returns name -> function to time for the engine with the baseline agents."""
+    guesser, spymaster = agents.RandomGuesser(), agents.RandomSpymaster()
+    mid_game = new_game()
+    for word in mid_game.words[:10]:
+        mid_game.guess_word([word, ""])
+
+    def display():
+        # drop the cached rendering so the board is really built every call
+        mid_game._board_cache.clear()
+        mid_game.display()
+
+    benchmarks = {
+        "game_display": display,
+        "game_get_score": mid_game.get_score,
+        "play_one_round": lambda: new_game().play_one_round(guesser, spymaster, verbose=False),
+        "game_play": lambda: new_game().play(guesser, spymaster),
+    }
+    if os.path.exists(words.PATH_TO_WORDS):
+        benchmarks["words_main"] = lambda: words.main(25)
+    return benchmarks
+
+
+def ai_benchmarks(server_url):
+    """Returns name -> function playing AI agent rounds against the mock server at server_url."""
+    benchmarks = {}
+    for name, stop_at in [("ai_play_one_round", None), ("ai_play_one_round_streaming", backends.STOP_AT)]:
+        backend = backends.AnthropicBackend(base_url=server_url, api_key="test", max_retries=0, stop_at=stop_at)
+        guesser, spymaster = agents.AIGuesser(backend=backend), agents.AISpymaster(backend=backend)
+        benchmarks[name] = lambda guesser=guesser, spymaster=spymaster: new_game().play_one_round(guesser, spymaster, verbose=False)
+    return benchmarks
+
+
+def import_seconds(modules=ENGINE_MODULES, repeats=3):
+    """
+    Imports modules in a fresh interpreter repeats times.
+    Returns:
+        (seconds, heavy): the fastest import time, and which of HEAVY_MODULES the import loaded.
+    """
+    script = ("import sys, time\n"
+              "start = time.perf_counter()\n"
+              f"import {', '.join(modules)}\n"
+              "print(time.perf_counter() - start)\n"
+              f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    best, heavy = float("inf"), []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split("\n")
+        best = min(best, float(output[0]))
+        heavy = [module for module in output[1].split(",") if module]
+    return best, heavy
+
+
+def run(min_seconds=0.5, latency=0.0, include_ai=True, word_delay=0.0):
+    """Returns name -> calls per second for every benchmark."""
+    results = {}
+    # the engine prints while it plays, which would swamp the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, fn in engine_benchmarks().items():
+            results[name] = measure(fn, min_seconds)
+        if include_ai:
+            with mock_server.MockServer(latency=latency, word_delay=word_delay) as server:
+                for name, fn in ai_benchmarks(server.url).items():
+                    results[name] = measure(fn, min_seconds, repeats=1)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the names of benchmarks whose throughput dropped by more than threshold."""
+    return [name for name, ops in results.items()
+            if name in baseline and ops < baseline[name] * (1 - threshold)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline.")
+    parser.add_argument("--baseline_path", type=str, default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fail if throughput drops by more than this fraction of the baseline.")
+    parser.add_argument("--min_seconds", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the mock server waits before answering each model call.")
+    parser.add_argument("--word_delay", type=float, default=0.0,
+                        help="Seconds the mock model takes per word it writes.")
+    parser.add_argument("--no_ai", action="store_true", help="Skip the AI agent benchmarks.")
+    args = parser.parse_args()
+
+    results = run(args.min_seconds, args.latency, include_ai=not args.no_ai, word_delay=args.word_delay)
+    baseline = {}
+    if os.path.exists(args.baseline_path):
+        with open(args.baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    for name, ops in results.items():
+        change = f" ({ops / baseline[name] - 1:+.0%} vs baseline)" if name in baseline else ""
+        print(f"{name:>20}: {ops:12.1f} calls/s{change}")
+    seconds, heavy = import_seconds()
+    print(f"{'import_engine':>20}: {seconds * 1000:12.1f} ms (budget {IMPORT_BUDGET_SECONDS * 1000:.0f} ms)")
+    over_budget = seconds > IMPORT_BUDGET_SECONDS or heavy
+    if over_budget:
+        print(f"Importing {', '.join(ENGINE_MODULES)} took {seconds:.2f}s and loaded {heavy or 'nothing heavy'}")
+    if args.save:
+        with open(args.baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline_path}")
+        return
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"Throughput regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+    if regressions or over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+A persistent on-disk cache for LLM responses.
+
+Agents call the model at temperature 0, so the same (model, system prompt, message) always gives
+the same answer. The cache stores the raw response text keyed on a hash of those inputs so reruns
+of seeded boards don't hit the network.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+MODES = ("readwrite", "replay")
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a response isn't in the cache."""
+
+
+def make_key(model, system_prompt, message):
+    payload = json.dumps([model, system_prompt, message], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache():
+    def __init__(self, path, max_entries=100_000, mode="readwrite"):
+        """
+        Args:
+            path: str, sqlite file to store responses in. ":memory:" keeps it in memory.
+            max_entries: int, least recently used entries are evicted past this size.
+            mode: str, "readwrite" stores new responses, "replay" never writes and raises
+                CacheMiss on a miss so no network call is made.
+        """
+        assert mode in MODES, f"mode must be one of {MODES}"
+        self.path = path
+        self.max_entries = max_entries
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if mode == "replay" and path != ":memory:":
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No cache to replay at {path}")
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses "
+                               "(key TEXT PRIMARY KEY, response TEXT, last_used REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS last_used_idx ON responses (last_used)")
+            self._conn.commit()
+
+    @property
+    def replay(self):
+        return self.mode == "replay"
+
+    def get(self, model, system_prompt, message):
+        """Returns the cached response string, or None on a miss (CacheMiss in replay mode)."""
+        key = make_key(model, system_prompt, message)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMiss(key)
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        return row[0]
+
+    def put(self, model, system_prompt, message, response):
+        if self.replay:
+            return
+        key = make_key(model, system_prompt, message)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, response, last_used) VALUES (?, ?, ?)",
+                               (key, response, time.time()))
+            n_entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if n_entries > self.max_entries:
+                self._conn.execute("DELETE FROM responses WHERE key IN "
+                                   "(SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                                   (n_entries - self.max_entries,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        self._conn.close()
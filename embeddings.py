@@ -0,0 +1,185 @@
+"""
+Local agents that play from word embeddings instead of calling an LLM.
+
+The index is a float32 .npy matrix of unit length word vectors next to a .vocab.txt file with one
+word per line. The matrix is memory-mapped, so loading it is instant and pages are only read as
+they are used. Every vocab word is a candidate clue.
+"""
+import os
+
+import numpy as np
+
+import constants
+from game import Guesser, Spymaster
+
+INDEX_PATH = "embeddings/index.npy"
+
+
+def vocab_path(index_path):
+    return os.path.splitext(index_path)[0] + ".vocab.txt"
+
+
+def build_index(vectors_path, index_path=INDEX_PATH, max_words=50_000, board_words=()):
+    """
+    Builds an index from a GloVe style text file, where each line is a word followed by its vector.
+    Keeps the first max_words purely alphabetic words, which are the most frequent ones in GloVe
+    files, plus any of board_words further down the file.
+    """
+    board_words = {word.lower() for word in board_words}
+    vocab, vectors = [], []
+    with open(vectors_path, encoding="utf-8") as f:
+        for line in f:
+            word, *values = line.rstrip().split(" ")
+            if not word.isalpha():
+                continue
+            if len(vocab) < max_words or word in board_words:
+                vocab.append(word)
+                vectors.append(np.array(values, dtype=np.float32))
+    matrix = np.stack(vectors)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    np.save(index_path, matrix)
+    with open(vocab_path(index_path), "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+
+
+class WordEmbeddings():
+    def __init__(self, index_path=INDEX_PATH):
+        self.matrix = np.load(index_path, mmap_mode="r")
+        with open(vocab_path(index_path), encoding="utf-8") as f:
+            self.vocab = f.read().split("\n")
+        assert len(self.vocab) == len(self.matrix), "Vocab doesn't match the index"
+        self.word_ids = {word: i for i, word in enumerate(self.vocab)}
+        self.vocab_array = np.array(self.vocab)
+
+    def __contains__(self, word):
+        return word.lower() in self.word_ids
+
+    def vectors(self, words):
+        """Returns a (len(words), d) matrix. Words missing from the index get a zero vector."""
+        out = np.zeros((len(words), self.matrix.shape[1]), dtype=np.float32)
+        for i, word in enumerate(words):
+            word_id = self.word_ids.get(word.lower())
+            if word_id is not None:
+                out[i] = self.matrix[word_id]
+        return out
+
+
+def board_groups(state):
+    """Splits the unguessed words into (team, opponent, neutral, assassin) lists from the spymaster's view."""
+    groups = {"team": [], "opponent": [], "neutral": [], "assassin": []}
+    for word in state.words:
+        if word in state.guesses:
+            continue
+        color = state.code[word]
+        if color == state.curr_team:
+            groups["team"].append(word)
+        elif color == "NEUTRAL":
+            groups["neutral"].append(word)
+        elif color == "ASSASIN":
+            groups["assassin"].append(word)
+        else:
+            groups["opponent"].append(word)
+    return groups
+
+
+class EmbeddingSpymaster(Spymaster):
+    def __init__(self, embeddings=None, max_n=4, margin=0.05, neutral_slack=0.05, assassin_margin=0.1):
+        """
+        A clue counts for every team word that is closer to it than any dangerous word, plus margin.
+        Args:
+            embeddings: WordEmbeddings, defaults to the one at INDEX_PATH.
+            max_n: int, most words one clue can be for.
+            neutral_slack: float, neutral words are less dangerous, so their similarity is lowered by this.
+            assassin_margin: float, the assassin is very dangerous, so its similarity is raised by this.
+        """
+        super().__init__()
+        self.embeddings = embeddings if embeddings is not None else WordEmbeddings()
+        self.max_n = max_n
+        self.margin = margin
+        self.neutral_slack = neutral_slack
+        self.assassin_margin = assassin_margin
+
+    def valid_clues(self, board_words):
+        """Returns a bool mask over the vocab of words allowed as a clue on this board. A clue can't
+        contain a board word or be part of one, so it doesn't give the word away."""
+        valid = np.ones(len(self.embeddings.vocab), dtype=bool)
+        for word in board_words:
+            word = word.lower()
+            valid &= np.char.find(self.embeddings.vocab_array, word) == -1
+            for start in range(len(word)):
+                for end in range(start + 1, len(word) + 1):
+                    word_id = self.embeddings.word_ids.get(word[start:end])
+                    if word_id is not None:
+                        valid[word_id] = False
+        return valid
+
+    def score_clues(self, state):
+        """
+        Returns (n, score) arrays over the vocab. Similarities to every unguessed card come from one
+        matrix multiply of the whole index against the board.
+        """
+        groups = board_groups(state)
+        board_words = groups["team"] + groups["opponent"] + groups["neutral"] + groups["assassin"]
+        similarities = self.embeddings.matrix @ self.embeddings.vectors(board_words).T
+        n_team, n_opponent, n_neutral = len(groups["team"]), len(groups["opponent"]), len(groups["neutral"])
+        team = similarities[:, :n_team]
+        danger = np.full(len(similarities), -1.0, dtype=np.float32)
+        if n_opponent:
+            danger = np.maximum(danger, similarities[:, n_team:n_team + n_opponent].max(axis=1))
+        if n_neutral:
+            neutral = similarities[:, n_team + n_opponent:n_team + n_opponent + n_neutral]
+            danger = np.maximum(danger, neutral.max(axis=1) - self.neutral_slack)
+        if groups["assassin"]:
+            danger = np.maximum(danger, similarities[:, -1] + self.assassin_margin)
+
+        team_sorted = -np.sort(-team, axis=1)[:, :self.max_n]
+        n = (team_sorted > (danger + self.margin)[:, None]).sum(axis=1)
+        # ties on n go to the clue whose weakest intended word is furthest from the danger
+        weakest = team_sorted[np.arange(len(team_sorted)), np.maximum(n, 1) - 1]
+        score = n + (weakest - danger)
+        score[~self.valid_clues(state.words)] = -np.inf
+        return np.maximum(n, 1), score
+
+    def get_move(self, state):
+        n, score = self.score_clues(state)
+        best = int(np.argmax(score))
+        return self.embeddings.vocab[best].capitalize(), int(n[best])
+
+
+class EmbeddingGuesser(Guesser):
+    def __init__(self, embeddings=None, threshold=0.25):
+        """
+        Ranks the unguessed words against the clue once, then hands them out in order over the
+        following get_move calls.
+        Args:
+            embeddings: WordEmbeddings, defaults to the one at INDEX_PATH.
+            threshold: float, the turn ends instead of guessing a word less similar to the clue than this.
+        """
+        super().__init__()
+        self.embeddings = embeddings if embeddings is not None else WordEmbeddings()
+        self.threshold = threshold
+        # (key, ranking) with ranking a list of (word, similarity), most similar first. One tuple,
+        # replaced whole, so threads sharing the guesser never see a key with another clue's ranking
+        self._ranking = (None, [])
+
+    def rank(self, state):
+        clue = state.clues[-1][0]
+        candidates = [word for word in state.words if word not in state.guesses]
+        similarities = self.embeddings.vectors(candidates) @ self.embeddings.vectors([clue])[0]
+        order = np.argsort(-similarities, kind="stable")
+        return [(candidates[i], float(similarities[i])) for i in order]
+
+    def get_move(self, state):
+        key = (state.clues[-1], len(state.clues), tuple(state.words))
+        ranking_key, ranking = self._ranking
+        if key != ranking_key:
+            ranking = self.rank(state)
+            self._ranking = (key, ranking)
+        # skipping guessed words, rather than keeping a position, also works after a rollback
+        for word, similarity in ranking:
+            if similarity < self.threshold:
+                break
+            if word not in state.guesses:
+                return word, f"{word} is {similarity:.2f} similar to {state.clues[-1][0]}"
+        return constants.END_OF_TURN, ""
@@ -5,67 +5,121 @@ This is an implementation of code names
 from abc import ABC, abstractmethod
 from typing import Tuple, List
 import types
-import tabulate
-from colorama import Fore, Style
+import copy
+import asyncio
+import contextvars
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import random
+import threading
 import constants
+import metrics
+import render
+import rules
+from rules import COLORS, COLOR_IDS, generate_code
 
 MAX_TRIES = 5
+# True while a rollout round is being played, so shared services like the scheduler can put real moves first
+in_rollout = contextvars.ContextVar("in_rollout", default=False)
 
 class Guesser(ABC):
+    # whether get_ranked_moves can return several guesses, which the game then plays from one call
+    ranks_guesses = False
+
     @abstractmethod
     def get_move(self, state) -> Tuple[str, str]:
         """Returns guess and thoughts about that guess."""
         raise NotImplementedError()
 
+    async def get_move_async(self, state) -> Tuple[str, str]:
+        """Async version of get_move. By default this just calls get_move, which is fine for agents
+        that don't block. Agents that wait on the network should override it."""
+        return self.get_move(state)
+
+    def get_ranked_moves(self, state, n) -> List[Tuple[str, str]]:
+        """Returns up to n (guess, thoughts), best first. Only used when ranks_guesses is True."""
+        return [self.get_move(state)]
+
+    async def get_ranked_moves_async(self, state, n) -> List[Tuple[str, str]]:
+        return [await self.get_move_async(state)]
+
 class Spymaster(ABC):
     @abstractmethod
     def get_move(self, state) -> Tuple[str, int]:
         """Returns clue and number of words that clue is for."""
         raise NotImplementedError()
 
-def generate_code(words):
-    #TODO Have this work with board size of not just 25.
-    assert len(words) == 25, "Haven't implemented code for board size other than 25 yet"
-    n_blue = constants.N_BLUE
-    n_red = constants.N_RED
-    n_neutral = len(words) - n_blue - n_red - 1
-
-    blue_words = words[:n_blue]
-    red_words = words[n_blue:n_blue+n_red]
-    neutral_words = words[n_blue+n_red:n_blue+n_red+n_neutral]
-    assasin_word = words[n_blue+n_red+n_neutral]
-    code = {}
-    for word in blue_words:
-        code[word] = "BLUE"
-    for word in red_words:
-        code[word] = "RED"
-    for word in neutral_words:
-        code[word] = "NEUTRAL"
-    code[assasin_word] = "ASSASIN"
-    return code
-
-def get_color(key):
-    """
-    Given either BLUE, RED, ASSASIN (yellow), or NEUTRAL (black), return the color code
-    """
-    if key == "BLUE":
-        return Fore.BLUE
-    elif key == "RED":
-        return Fore.RED
-    elif key == "ASSASIN":
-        return Fore.YELLOW
-    elif key == "NEUTRAL":
-        return Fore.BLACK
-    else:
-        return Fore.WHITE
+    async def get_move_async(self, state) -> Tuple[str, int]:
+        """Async version of get_move. By default this just calls get_move, which is fine for agents
+        that don't block. Agents that wait on the network should override it."""
+        return self.get_move(state)
+
+class ThreadedAgent():
+    """Wraps a blocking sync agent so get_move_async runs it in a worker thread instead of
+    stalling the event loop."""
+    def __init__(self, agent):
+        self.agent = agent
+
+    @property
+    def ranks_guesses(self):
+        return getattr(self.agent, "ranks_guesses", False)
+
+    def get_move(self, state):
+        return self.agent.get_move(state)
+
+    async def get_move_async(self, state):
+        return await asyncio.to_thread(self.agent.get_move, state)
+
+    def get_ranked_moves(self, state, n):
+        return self.agent.get_ranked_moves(state, n)
+
+    async def get_ranked_moves_async(self, state, n):
+        return await asyncio.to_thread(self.agent.get_ranked_moves, state, n)
+
+class GuessMemo():
+    def __init__(self):
+        """
+        Remembers what the guesser did on a board and clue, so rollouts that give a clue already
+        tried on the same board replay the guesser's earlier answer instead of asking it again.
+        The key is the guessed cards, the team and the latest clue, not the prompt, which also holds
+        things that don't change the guess, like older clues. Shared by a game and its forks.
+        Only use it with guessers that answer the same way every time, like AIGuesser at temperature 0.
+        """
+        self.moves = {}
+        self.hits = 0 # guesser calls saved
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            move = self.moves.get(key)
+            if move is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return move
+
+    def put(self, key, move):
+        with self._lock:
+            self.moves[key] = move
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"calls_saved": self.hits, "calls_made": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
 
 class Game():
-    def __init__(self, words, code=None, seed=None):
-        self.curr_team = "BLUE"
+    def __init__(self, words, code=None, seed=None, config=None):
+        """
+        Args:
+            code: dict of word -> color. If None, one is generated from config.
+            config: rules.BoardConfig, the number of cards of each color when generating the code.
+                Defaults to rules.default_config(len(words)), the standard counts scaled to the board.
+        """
         self.words = words
         if code is None:
-            code = generate_code(words)
+            code = generate_code(words, config)
         self.code = code
         # scramble the order of the words
         if seed is not None:
@@ -73,17 +127,55 @@ class Game():
         random.shuffle(self.words)
         self.game_response = ""
 
-        # These are the state variables that control the current progress of the game.
-        self.turns = 0
-        self.guesses = [] # words
-        self.guesser_thoughts = []
-        self.clues = [] # tuples of (word, number)
+        # The progress of the game lives in self.state, see GameState.
         self.rolled_back_results = [] # tuple of (list of clues (word, number), list of guesses, list of guesser thoughts)
         self.verbose = True # whether to print various things throughout each function.
-    
+        self.game_id = None # set when metrics are being recorded
+        self.log = None # gamelog.GameLog, set by gamelog.Writer.attach
+        self.guess_memo = None # GuessMemo, set to reuse the guesser's answers across rollouts
+        self._ranked_from_memo = False # whether the ranked guesses being played came from guess_memo
+        self.rollout_rank = 0 # set by play_rollouts on the forks of a wave, see there
+        self._reset_board_state()
+
+    def _reset_board_state(self):
+        """Indexes the board and starts a fresh GameState for it."""
+        self.board = rules.Board(self.words, self.code)
+        self.word_ids = self.board.word_ids
+        self.card_colors = self.board.colors
+        self.n_cards = dict(zip(COLORS, self.board.counts))
+        self.state = rules.new_state(self.board)
+        self._board_cache = {} # show_code -> (guessed bitmask, ai readable board)
+
+    # The game's progress is read and written through these so callers don't need to know about GameState.
+    curr_team = property(lambda self: self.state.curr_team, lambda self, team: setattr(self.state, "curr_team", team))
+    turns = property(lambda self: self.state.turns, lambda self, turns: setattr(self.state, "turns", turns))
+    guesses = property(lambda self: self.state.guesses)
+    guesser_thoughts = property(lambda self: self.state.guesser_thoughts)
+    clues = property(lambda self: self.state.clues)
+
+    @property
+    def remaining(self):
+        """Number of unguessed cards of each color."""
+        return dict(zip(COLORS, self.state.remaining))
+
+    def is_guessed(self, word):
+        return self.state.is_guessed(self.word_ids[word])
+
+    def revealed(self):
+        """Returns guessed word -> its color, in the order the words were guessed."""
+        return {word: self.code[word] for word in self.guesses}
+
+    def snapshot(self):
+        """Returns the game's progress, which restore() can go back to."""
+        return self.state.snapshot()
+
+    def restore(self, snapshot):
+        self.state.restore(snapshot)
+
     def set_state(self, words, code):
         self.words = words
         self.code = code
+        self._reset_board_state()
 
     def get_guesser_state(self, print_human_readable=False):
         state = types.SimpleNamespace()
@@ -91,6 +183,7 @@ class Game():
         state.words = self.words
         state.board = self.display(print_human_readable=print_human_readable, show_code=False)
         state.guesses = self.guesses
+        state.revealed = self.revealed()
         state.clues = self.clues
         state.game_response = self.game_response
         return state
@@ -101,6 +194,7 @@ class Game():
         state.words = self.words
         state.board = self.display(print_human_readable=print_human_readable, show_code=False)
         state.guesses = self.guesses
+        state.revealed = self.revealed()
         state.clues = self.clues
         state.game_response = self.game_response
 
@@ -108,6 +202,7 @@ class Game():
         state.board_with_code = self.display(show_code=True)
         state.guesser_thoughts = self.guesser_thoughts
         state.rolled_back_results = self.rolled_back_results
+        state.rollout_rank = self.rollout_rank
         return state
 
     def guess_word(self, action: List[str]):
@@ -118,36 +213,36 @@ class Game():
             return True, constants.END_OF_TURN
         word = word[0].upper() + word[1:].lower()
         if self.verbose:
-            if self.curr_team == "BLUE":
-                print(Fore.BLUE + f"Guessing {word}" + Style.RESET_ALL)
-            else:
-                print(Fore.RED + f"Guessing {word}" + Style.RESET_ALL)
-        if word not in self.code:
+            with metrics.phase("rendering"):
+                render.announce(self.curr_team, f"Guessing {word}")
+        card = self.word_ids.get(word)
+        if card is None:
             return False, f"Word {word} not on the board. Pick a word on the board."
-        if word in self.guesses:
+        color = rules.guess(self.board, self.state, card, word, thoughts)
+        if color is None:
             return False, f"Word {word} already guessed. Pick a word not already guessed."
-        self.guesses.append(word)
-        self.guesser_thoughts.append(thoughts)
-        return True, self.code[word]
+        if self.log is not None and not in_rollout.get():
+            self.log.guess(self.curr_team, card, thoughts)
+        return True, COLORS[color]
 
     def give_clue(self, action):
         """
-        Stores the word along with the number of words that clue is for.
+        Stores the word along with the number of words that clue is for, as an int.
         """
         word, n = action
-        if word in self.code:
-            return False, f"Word {word} is already on the board. Pick a word not on the board."
-        elif " " in word:
-            return False, f"Word {word} contains a space. Pick a word without a space."
-        elif "-" in word:
-            return False, f"Word {word} contains a dash. Pick a word that isn't hyphonated"
-        # TODO add more constraints here if we run into problems.
-        if self.verbose:    
-            if self.curr_team == "BLUE":
-                print(Fore.BLUE + f"Giving clue {word},{n}" + Style.RESET_ALL)
-            else:
-                print(Fore.RED + f"Giving clue {word},{n}" + Style.RESET_ALL)
-        self.clues.append((word, n))
+        try:
+            n = int(n)
+        except (TypeError, ValueError):
+            return False, f"Number {n} is not a whole number. Give how many words the clue is for as a whole number."
+        error = rules.clue_error(self.board, word)
+        if error is not None:
+            return False, error
+        if self.verbose:
+            with metrics.phase("rendering"):
+                render.announce(self.curr_team, f"Giving clue {word},{n}")
+        self.state.give_clue((word, n))
+        if self.log is not None and not in_rollout.get():
+            self.log.clue(self.curr_team, word, n)
         return True, f"{word},{n}"
 
     def display(self, print_human_readable=False, show_code=False):
@@ -156,94 +251,344 @@ class Game():
         Args:
             show_code: bool, whether to reveal the code words as to the code master.
         Returns:
-            ai readable formatted board state.
+            ai readable formatted board state. Without print_human_readable this is cached until the
+            next guess, so callers must not modify it.
         """
-        # Prepare the board data
-        board_data = []
-        ai_format = []
-        for i in range(0, len(self.words), 5):  # stride words by 4
-            row = []
-            for word in self.words[i:i+5]:  # Get 4 words for the row
-                if show_code or word in self.guesses:
-                    if print_human_readable: row.append(get_color(self.code[word]) + word + Style.RESET_ALL)
-                    ai_format.append(f"{word} ({self.code[word]})")
-                else:
-                    row.append(word)
-                    ai_format.append(f"{word} (Unknown)")
-            board_data.append(row)
-        # Print the board using tabulate
-        if print_human_readable:
-            print(tabulate.tabulate(board_data, tablefmt="grid"))
+        # the board with the code is the same whatever has been guessed
+        guessed = None if show_code else self.state.guessed
+        if not print_human_readable and show_code in self._board_cache:
+            cached_guessed, cached_board = self._board_cache[show_code]
+            if cached_guessed == guessed:
+                return cached_board
+        with metrics.phase("rendering"):
+            if print_human_readable:
+                render.print_board(self.board, self.state, show_code)
+            ai_format = render.ai_board(self.board, self.state, show_code)
+        self._board_cache[show_code] = (guessed, ai_format)
         return ai_format
     
     def make_move(self, player, state_fn, move_fn):
         tries = 0
         made_move = False
-        while tries < MAX_TRIES:
-            move = player.get_move(state_fn())
-            success, response = move_fn(move)
-            if success:
-                made_move = True
-                break
-            self.game_response += "\n" + response
-            if self.verbose:
-                print(f"{tries = }, {response = }")
-            tries += 1
+        with metrics.labels(role="spymaster" if move_fn == self.give_clue else "guesser"):
+            while tries < MAX_TRIES:
+                move = player.get_move(state_fn())
+                success, response = move_fn(move)
+                if success:
+                    made_move = True
+                    break
+                self._record_failed_move(tries, response)
+                tries += 1
+            metrics.record("move", tries=tries + made_move, success=made_move)
         self.game_response = ""
         return made_move, response
 
-    def play_one_round(self, guesser, spymaster, rollback=False, override_curr_team=None, verbose=True):
+    async def make_move_async(self, player, state_fn, move_fn):
+        """Same as make_move but awaits the player's get_move_async."""
+        tries = 0
+        made_move = False
+        with metrics.labels(role="spymaster" if move_fn == self.give_clue else "guesser"):
+            while tries < MAX_TRIES:
+                move = await player.get_move_async(state_fn())
+                success, response = move_fn(move)
+                if success:
+                    made_move = True
+                    break
+                self._record_failed_move(tries, response)
+                tries += 1
+            metrics.record("move", tries=tries + made_move, success=made_move)
+        self.game_response = ""
+        return made_move, response
+
+    def make_ranked_guess(self, guesser, ranked, n_left):
         """
+        Plays the next of the guesser's ranked guesses, asking for up to n_left new ones when ranked
+        is empty. If a guess is invalid the rest of the ranking is dropped and the guesser is asked
+        for a single guess with make_move.
         Args:
-            guesser: obj, guesser agent
-            spymaster: obj, spymaster agent
-            rollback: bool, whether to rollback the game state to the previous round, so that the spymaster can see the guesser's thoughts.
-            override_curr_team: str, if not None, the current team to play as.
-        Returns:
-            n_guesses_made: int, number of guesses made
-            round_response: str, "LOSE", "handover", or constants.END_OF_TURN
+            ranked: list of (guess, thoughts) not played yet, which is updated in place.
+        """
+        if not ranked:
+            key = self._memo_key(n_left)
+            moves = self._memo_get(key)
+            self._ranked_from_memo = moves is not None
+            if moves is None:
+                with metrics.labels(role="guesser"):
+                    moves = guesser.get_ranked_moves(self.get_guesser_state(), n_left)
+                self._memo_put(key, list(moves))
+            ranked.extend(moves)
+        return self._play_ranked_guess(ranked, memo=self._ranked_from_memo) or self._make_guess(guesser)
+
+    async def make_ranked_guess_async(self, guesser, ranked, n_left):
+        """Same as make_ranked_guess but awaits the guesser."""
+        if not ranked:
+            key = self._memo_key(n_left)
+            moves = self._memo_get(key)
+            self._ranked_from_memo = moves is not None
+            if moves is None:
+                with metrics.labels(role="guesser"):
+                    moves = await guesser.get_ranked_moves_async(self.get_guesser_state(), n_left)
+                self._memo_put(key, list(moves))
+            ranked.extend(moves)
+        return self._play_ranked_guess(ranked, memo=self._ranked_from_memo) or await self._make_guess_async(guesser)
+
+    def _play_ranked_guess(self, ranked, memo=False):
+        """
+        Returns the result of the first ranked guess, or None if it was invalid.
+        Args:
+            memo: bool, whether ranked came from guess_memo rather than the guesser.
         """
+        success, response = self.guess_word(ranked.pop(0))
+        if success:
+            with metrics.labels(role="guesser"):
+                metrics.record("move", tries=1, success=True, memo=memo)
+            return success, response
+        ranked.clear()
+        self._record_failed_move(0, response)
+        return None
+
+    def _guess(self, guesser, ranked, n_left):
+        if getattr(guesser, "ranks_guesses", False):
+            return self.make_ranked_guess(guesser, ranked, n_left)
+        return self._make_guess(guesser)
+
+    async def _guess_async(self, guesser, ranked, n_left):
+        if getattr(guesser, "ranks_guesses", False):
+            return await self.make_ranked_guess_async(guesser, ranked, n_left)
+        return await self._make_guess_async(guesser)
+
+    def _memo_key(self, n_ranked=None):
+        """The guessed cards, team and latest clue, which are all a guess depends on, plus how many
+        guesses were asked for when ranking."""
+        return self.state.guessed, self.curr_team, self.clues[-1], n_ranked
+
+    def _memo_get(self, key):
+        return self.guess_memo.get(key) if self.guess_memo is not None else None
+
+    def _memo_put(self, key, move):
+        if self.guess_memo is not None:
+            self.guess_memo.put(key, move)
+
+    def _remembered_guess(self, key):
+        """Returns the result of replaying the memo's guess for key, or None if there is none or it
+        isn't valid any more."""
+        move = self._memo_get(key)
+        if move is None:
+            return None
+        success, response = self.guess_word(move)
+        if not success:
+            return None
+        with metrics.labels(role="guesser"):
+            metrics.record("move", tries=1, success=True, memo=True)
+        return success, response
+
+    def _remembering_guess_word(self, key):
+        """Returns a guess_word that also stores the guesses it accepts in the memo under key."""
+        if self.guess_memo is None:
+            return self.guess_word
+        def guess_word(move):
+            success, response = self.guess_word(move)
+            if success:
+                self.guess_memo.put(key, move)
+            return success, response
+        return guess_word
+
+    def _make_guess(self, guesser):
+        key = self._memo_key()
+        return (self._remembered_guess(key)
+                or self.make_move(guesser, self.get_guesser_state, self._remembering_guess_word(key)))
+
+    async def _make_guess_async(self, guesser):
+        key = self._memo_key()
+        return (self._remembered_guess(key)
+                or await self.make_move_async(guesser, self.get_guesser_state, self._remembering_guess_word(key)))
+
+    def _record_failed_move(self, tries, response):
+        self.game_response += "\n" + response
+        if self.verbose:
+            print(f"{tries = }, {response = }")
+
+    def _assign_game_id(self):
+        """Gives the game its metrics id the first time it is needed while metrics are recorded."""
+        if self.game_id is None and metrics.active() is not None:
+            self.game_id = metrics.active().new_game_id()
+
+    @contextlib.contextmanager
+    def _round_context(self, rollback):
+        """Marks whether a rollout is being played, and labels the metrics recorded during the round
+        with the game and round they belong to."""
+        token = in_rollout.set(rollback)
+        try:
+            if metrics.active() is None:
+                yield
+                return
+            self._assign_game_id()
+            with metrics.labels(game=self.game_id, round=self.turns, rollout=rollback):
+                yield
+        finally:
+            in_rollout.reset(token)
+
+    def _start_round(self, override_curr_team, verbose):
+        """Returns the previous verbose option and a snapshot of the game, for _end_round."""
         if override_curr_team is not None:
             self.curr_team = override_curr_team
         previous_verbose_option = self.verbose
         self.verbose = verbose
-        clue_response = self.make_move(spymaster, self.get_spymaster_state, self.give_clue)
-        if verbose: print(clue_response)
-        max_guesses = int(clue_response[1].split(",")[1])
-        n_guesses_made = 0
-        round_response = None
-        while n_guesses_made < max_guesses:
-            guess_response = self.make_move(guesser, self.get_guesser_state, self.guess_word)
-            if verbose: print(guess_response)
-            if guess_response[1] == "ASSASIN":
-                round_response = "LOSE"
-                n_guesses_made += 1
-            elif guess_response[1] == constants.END_OF_TURN:
-                round_response = constants.END_OF_TURN
-            elif guess_response[1] != self.curr_team:
-                round_response = "handover"
-                n_guesses_made += 1
-            else:
-                n_guesses_made += 1
-                continue
-            break
+        return previous_verbose_option, self.snapshot()
+
+    def _resolve_guess(self, guess_response):
+        """Returns (counts_as_guess, round_response). round_response is None if the team keeps guessing."""
+        if guess_response[1] == constants.END_OF_TURN:
+            return False, constants.END_OF_TURN
+        if not guess_response[0]:
+            # the guesser used up its tries without a valid guess, which ends the turn
+            return True, rules.HANDOVER
+        return True, rules.turn_result(COLOR_IDS[guess_response[1]], COLOR_IDS[self.curr_team])
+
+    def _end_round(self, rollback, n_guesses_made, round_response, round_start):
+        previous_verbose_option, snapshot = round_start
         if rollback:
-            self.rolled_back_results.append((self.clues[-1], self.guesses[-n_guesses_made:], self.guesser_thoughts[-n_guesses_made:], (n_guesses_made, round_response)))
-            self.guesses = self.guesses[:-n_guesses_made]
-            self.guesser_thoughts = self.guesser_thoughts[:-n_guesses_made]
-            self.clues = self.clues[:-1]
+            n_kept = len(snapshot[2])
+            self.rolled_back_results.append((self.clues[-1], list(self.guesses[n_kept:]), list(self.guesser_thoughts[n_kept:]), (n_guesses_made, round_response)))
+            if self.log is not None:
+                self.log.rollout(self.curr_team, self.rolled_back_results[-1])
+            self.restore(snapshot)
         else:
             # reset rolled back results after we play a round
             self.rolled_back_results = []
         self.verbose = previous_verbose_option
+        metrics.record("round", team=self.curr_team, n_guesses_made=n_guesses_made, round_response=round_response)
+
+    def play_one_round(self, guesser, spymaster, rollback=False, override_curr_team=None, verbose=True):
+        """
+        Args:
+            guesser: obj, guesser agent
+            spymaster: obj, spymaster agent
+            rollback: bool, whether to rollback the game state to the previous round, so that the spymaster can see the guesser's thoughts.
+            override_curr_team: str, if not None, the current team to play as.
+        Returns:
+            n_guesses_made: int, number of guesses made
+            round_response: str, "LOSE", "handover", or constants.END_OF_TURN
+        """
+        with self._round_context(rollback):
+            round_start = self._start_round(override_curr_team, verbose)
+            with metrics.phase("clue"):
+                clue_response = self.make_move(spymaster, self.get_spymaster_state, self.give_clue)
+            if verbose: print(clue_response)
+            max_guesses = int(clue_response[1].split(",")[1])
+            n_guesses_made = 0
+            round_response = None
+            ranked = [] # guesses the guesser ranked but that haven't been played yet
+            while n_guesses_made < max_guesses:
+                with metrics.phase("guess"):
+                    guess_response = self._guess(guesser, ranked, max_guesses - n_guesses_made)
+                if verbose: print(guess_response)
+                with metrics.phase("scoring"):
+                    counts_as_guess, round_response = self._resolve_guess(guess_response)
+                if counts_as_guess:
+                    n_guesses_made += 1
+                if round_response is not None:
+                    break
+            self._end_round(rollback, n_guesses_made, round_response, round_start)
         return n_guesses_made, round_response
 
+    async def play_one_round_async(self, guesser, spymaster, rollback=False, override_curr_team=None, verbose=True):
+        """Same as play_one_round but awaits the agents, so many games can share one event loop."""
+        with self._round_context(rollback):
+            round_start = self._start_round(override_curr_team, verbose)
+            with metrics.phase("clue"):
+                clue_response = await self.make_move_async(spymaster, self.get_spymaster_state, self.give_clue)
+            if verbose: print(clue_response)
+            max_guesses = int(clue_response[1].split(",")[1])
+            n_guesses_made = 0
+            round_response = None
+            ranked = []
+            while n_guesses_made < max_guesses:
+                with metrics.phase("guess"):
+                    guess_response = await self._guess_async(guesser, ranked, max_guesses - n_guesses_made)
+                if verbose: print(guess_response)
+                with metrics.phase("scoring"):
+                    counts_as_guess, round_response = self._resolve_guess(guess_response)
+                if counts_as_guess:
+                    n_guesses_made += 1
+                if round_response is not None:
+                    break
+            self._end_round(rollback, n_guesses_made, round_response, round_start)
+        return n_guesses_made, round_response
+
+    def fork(self):
+        """Returns an independent copy of the game that can be played without affecting this one.
+        The words and code are never mutated after init, so they are shared."""
+        # forks record under the game's id, so it has to exist before they copy it
+        self._assign_game_id()
+        forked = copy.copy(self)
+        forked.state = self.state.fork()
+        forked.rolled_back_results = list(self.rolled_back_results)
+        forked._board_cache = dict(self._board_cache)
+        forked.log = None # play_rollouts logs the forks' rollouts in order
+        return forked
+
+    def play_rollouts(self, guesser, spymaster, n_rollouts, override_curr_team=None, max_workers=None,
+                      should_stop=None):
+        """
+        Plays n_rollouts simulated rounds in waves of max_workers concurrent rollouts, each on its own
+        fork of the game, and appends their results to rolled_back_results in rollout order.
+        Every wave sees the results of the waves before it, like calling play_one_round with
+        rollback=True n times does, so max_workers=1 is the same as that. Within a wave, fork i has
+        rollout_rank i, which the AI spymaster reads as asking for the clue it ranks number i + 1
+        rather than its best, so the rollouts of a wave try different clues instead of repeating one.
+        Args:
+            max_workers: int, rollouts per wave. Defaults to all of them in one wave.
+            should_stop: callable, checked before each wave. Once it returns True no more waves are
+                started, and the rollouts played so far are returned.
+        Returns:
+            list of (n_guesses_made, round_response), one per rollout played.
+        """
+        if n_rollouts <= 0:
+            return []
+        def rollout(forked):
+            result = forked.play_one_round(guesser, spymaster, rollback=True,
+                                           override_curr_team=override_curr_team, verbose=False)
+            return result, forked.rolled_back_results[-1]
+        wave_size = max_workers or n_rollouts
+        results = []
+        with ThreadPoolExecutor(max_workers=wave_size) as executor:
+            for start in range(0, n_rollouts, wave_size):
+                if should_stop is not None and should_stop():
+                    break
+                forks = [self.fork() for _ in range(min(wave_size, n_rollouts - start))]
+                for rank, forked in enumerate(forks):
+                    forked.rollout_rank = rank
+                # threads don't inherit context variables, so hand each rollout a copy of ours for the metric labels
+                contexts = [contextvars.copy_context() for _ in forks]
+                outcomes = list(executor.map(lambda context, forked: context.run(rollout, forked), contexts, forks))
+                self.rolled_back_results.extend(rolled_back for _, rolled_back in outcomes)
+                if self.log is not None:
+                    for _, rolled_back in outcomes:
+                        self.log.rollout(override_curr_team or self.curr_team, rolled_back)
+                results += [result for result, _ in outcomes]
+        return results
+
     def get_score(self):
-        board_state = self.display()
-        score = {"BLUE": 0, "RED": 0}
-        score["BLUE"] = sum(1 for word in board_state if "BLUE" in word)
-        score["RED"] = sum(1 for word in board_state if "RED" in word)
-        return score
+        """Returns how many BLUE and RED cards have been revealed."""
+        remaining = self.state.remaining
+        return {"BLUE": self.n_cards["BLUE"] - remaining[COLOR_IDS["BLUE"]], "RED": self.n_cards["RED"] - remaining[COLOR_IDS["RED"]]}
+
+    def _round_winner(self, round_response, verbose):
+        """Returns the winning team after a round, or None if the game goes on."""
+        if verbose:
+            with metrics.phase("rendering"):
+                real_score = self.get_score()
+                print(self.display(print_human_readable=True))
+                print(f"{self.curr_team = }, {real_score = }")
+        with metrics.phase("scoring"):
+            return rules.winner(self.state, self.curr_team, round_response)
+
+    def _end_game(self, winner):
+        with metrics.labels(game=self.game_id):
+            metrics.record("game", winner=winner, turns=self.turns)
+        if self.log is not None:
+            self.log.finish(winner, self.turns)
 
     def play(self, guesser, spymaster, verbose=False, max_turns=25):
         teams = ["BLUE", "RED"]
@@ -251,22 +596,32 @@ class Game():
         winner = None
         while self.turns < max_turns:
             self.curr_team = teams[curr_team]
-            n_guesses_made, round_response = self.play_one_round(guesser, spymaster)
-            print(f"round result: {n_guesses_made}, {round_response}")
-            # get the real score by counting in board sate how many times blue or red are written
-            real_score = self.get_score()
-            if verbose:
-                print(self.display(print_human_readable=True))
-                print(f"{self.curr_team = }, {real_score = }")
-            if round_response == "LOSE":
-                winner = "BLUE" if self.curr_team == "RED" else "RED"
+            # rounds only announce moves when the game is verbose
+            n_guesses_made, round_response = self.play_one_round(guesser, spymaster, verbose=self.verbose)
+            with metrics.phase("rendering"):
+                print(f"round result: {n_guesses_made}, {round_response}")
+            winner = self._round_winner(round_response, verbose)
+            if winner is not None:
                 break
-            elif real_score["BLUE"] == 8:
-                winner = "BLUE"
-                break
-            elif real_score["RED"] == 7:
-                winner = "RED"
+            self.turns += 1
+            curr_team = (curr_team + 1) % 2
+        self._end_game(winner)
+        return winner
+
+    async def play_async(self, guesser, spymaster, verbose=False, max_turns=25):
+        """Same as play but awaits the agents. Run many games at once with asyncio.gather."""
+        teams = ["BLUE", "RED"]
+        curr_team = 0
+        winner = None
+        while self.turns < max_turns:
+            self.curr_team = teams[curr_team]
+            n_guesses_made, round_response = await self.play_one_round_async(guesser, spymaster, verbose=self.verbose)
+            with metrics.phase("rendering"):
+                print(f"round result: {n_guesses_made}, {round_response}")
+            winner = self._round_winner(round_response, verbose)
+            if winner is not None:
                 break
             self.turns += 1
             curr_team = (curr_team + 1) % 2
-        return winner
\ No newline at end of file
+        self._end_game(winner)
+        return winner
@@ -0,0 +1,258 @@
+"""
+A compact binary log of finished games, for analysing many self-play games.
+
+The file starts with MAGIC and is a sequence of records, each a 1 byte kind and a 4 byte length
+followed by the payload. Records are only ever appended:
+    STRINGS: words and clues not seen before in this file, "\\0" separated. A string's id is its
+        position among all the strings written so far.
+    GAME: a game's board as string ids and color ids, then its events as fixed size structs, then
+        the guesser thoughts, "\\0" separated and zlib compressed.
+A Writer is attached to a Game and records every clue and guess the game applies, the rollouts
+the spymaster saw, and the winner. A Reader memory-maps the file, so games are only decoded when
+replayed or scanned for stats.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import constants
+import rules
+from rules import COLOR_IDS, COLORS, TEAMS
+
+MAGIC = b"CNLG\x01"
+STRINGS, GAME = 1, 2
+RECORD_HEADER = struct.Struct("<BI")
+GAME_HEADER = struct.Struct("<bHBHI") # winner, turns, n_cards, n_events, compressed thoughts length
+
+# events, in the order they happened
+CLUE, GUESS, ROLLOUT_CLUE, ROLLOUT_GUESS, ROLLOUT_END = range(5)
+# team is 0 for BLUE and 1 for RED. For clues a is the number and b the clue's string id, for
+# guesses a is the card and b the index of its thoughts, for ROLLOUT_END a is the number of
+# guesses made and b the round response code
+EVENT = np.dtype([("kind", "u1"), ("team", "u1"), ("a", "<u2"), ("b", "<u4")])
+ROUND_RESPONSES = (None, rules.HANDOVER, rules.LOSE, constants.END_OF_TURN)
+NO_WINNER = -1
+
+GameRecord = namedtuple("GameRecord", ["words", "colors", "events", "winner", "turns"])
+
+
+class GameLog():
+    def __init__(self, writer, a_game):
+        """Collects one game's events until finish() hands them to the writer."""
+        self.writer = writer
+        self.words = a_game.words
+        self.word_ids = a_game.word_ids
+        self.colors = a_game.card_colors
+        self.events = [] # (kind, team, a, b) with b a string for clues
+        self.thoughts = []
+        self._lock = threading.Lock()
+
+    def _thought(self, thoughts):
+        self.thoughts.append(thoughts or "")
+        return len(self.thoughts) - 1
+
+    def clue(self, team, word, n):
+        with self._lock:
+            self.events.append((CLUE, TEAMS.index(team), int(n), word))
+
+    def guess(self, team, card, thoughts):
+        with self._lock:
+            self.events.append((GUESS, TEAMS.index(team), card, self._thought(thoughts)))
+
+    def rollout(self, team, rolled_back):
+        """Records an entry of Game.rolled_back_results."""
+        (word, n), guesses, thoughts, (n_guesses_made, round_response) = rolled_back
+        team = TEAMS.index(team)
+        with self._lock:
+            self.events.append((ROLLOUT_CLUE, team, int(n), word))
+            for guess, thought in zip(guesses, thoughts):
+                self.events.append((ROLLOUT_GUESS, team, self.word_ids[guess], self._thought(thought)))
+            self.events.append((ROLLOUT_END, team, n_guesses_made, ROUND_RESPONSES.index(round_response)))
+
+    def finish(self, winner, turns):
+        self.writer.write(self, winner, turns)
+
+
+class Writer():
+    def __init__(self, path):
+        """Appends games to the log at path, creating it if needed. Safe to share between threads."""
+        self.path = path
+        self.string_ids = {}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            reader = Reader(path)
+            self.string_ids = {string: i for i, string in enumerate(reader.strings)}
+            end = reader.end
+            reader.close()
+            # drop a record cut short by a crash, so new records aren't appended inside it
+            os.truncate(path, end)
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    def attach(self, a_game):
+        """Starts logging a_game. It is written when a_game.play or play_async ends."""
+        a_game.log = GameLog(self, a_game)
+        return a_game.log
+
+    def _intern(self, strings, new_strings):
+        ids = []
+        for string in strings:
+            if string not in self.string_ids:
+                self.string_ids[string] = len(self.string_ids)
+                new_strings.append(string)
+            ids.append(self.string_ids[string])
+        return ids
+
+    def write(self, log, winner, turns):
+        with self._lock:
+            new_strings = []
+            word_ids = self._intern(log.words, new_strings)
+            events = np.zeros(len(log.events), dtype=EVENT)
+            for i, (kind, team, a, b) in enumerate(log.events):
+                if kind in (CLUE, ROLLOUT_CLUE):
+                    b = self._intern([b], new_strings)[0]
+                events[i] = (kind, team, a, b)
+            thoughts = zlib.compress("\0".join(log.thoughts).encode("utf-8"))
+            winner_id = TEAMS.index(winner) if winner is not None else NO_WINNER
+            payload = b"".join([
+                GAME_HEADER.pack(winner_id, turns, len(word_ids), len(events), len(thoughts)),
+                np.array(word_ids, dtype="<u4").tobytes(),
+                np.array(log.colors, dtype="u1").tobytes(),
+                events.tobytes(),
+                thoughts])
+            if new_strings:
+                self._write_record(STRINGS, "\0".join(new_strings).encode("utf-8"))
+            self._write_record(GAME, payload)
+            self.file.flush()
+
+    def _write_record(self, kind, payload):
+        self.file.write(RECORD_HEADER.pack(kind, len(payload)))
+        self.file.write(payload)
+
+    def close(self):
+        self.file.close()
+
+
+class Reader():
+    def __init__(self, path):
+        """Memory-maps the log at path. Opening it only reads the record headers and the strings."""
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a game log")
+        self.strings = []
+        self.offsets = [] # where each game's payload starts
+        self.end = len(MAGIC) # where the last complete record ends
+        while self.end + RECORD_HEADER.size <= len(self.data):
+            kind, length = RECORD_HEADER.unpack_from(self.data, self.end)
+            offset = self.end + RECORD_HEADER.size
+            if offset + length > len(self.data):
+                break # a record cut short by a crash while writing
+            if kind == STRINGS:
+                self.strings += self.data[offset:offset + length].decode("utf-8").split("\0")
+            elif kind == GAME:
+                self.offsets.append(offset)
+            self.end = offset + length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _read(self, index):
+        """Returns (header, word ids, colors, events, thoughts offset), without copying the arrays."""
+        offset = self.offsets[index]
+        header = GAME_HEADER.unpack_from(self.data, offset)
+        _, _, n_cards, n_events, _ = header
+        offset += GAME_HEADER.size
+        word_ids = np.frombuffer(self.data, dtype="<u4", count=n_cards, offset=offset)
+        offset += word_ids.nbytes
+        colors = np.frombuffer(self.data, dtype="u1", count=n_cards, offset=offset)
+        offset += colors.nbytes
+        events = np.frombuffer(self.data, dtype=EVENT, count=n_events, offset=offset)
+        return header, word_ids, colors, events, offset + events.nbytes
+
+    def game(self, index):
+        """Returns the GameRecord of the index-th game."""
+        (winner, turns, _, _, _), word_ids, colors, events, _ = self._read(index)
+        return GameRecord([self.strings[i] for i in word_ids], colors.copy(), events.copy(),
+                          TEAMS[winner] if winner != NO_WINNER else None, turns)
+
+    def thoughts(self, index):
+        """Returns the guesser thoughts of the index-th game, which GUESS events index into."""
+        (_, _, _, _, n_bytes), _, _, _, offset = self._read(index)
+        return zlib.decompress(self.data[offset:offset + n_bytes]).decode("utf-8").split("\0")
+
+    def replay(self, index, turn=None):
+        """
+        Returns a Game holding the index-th game as it was at the start of turn, counting from 0,
+        or at the end if turn is None. Rollouts are skipped.
+        """
+        import game # only needed here, and game imports this module's neighbours
+        record = self.game(index)
+        thoughts = self.thoughts(index)
+        code = {word: COLORS[color] for word, color in zip(record.words, record.colors)}
+        # no seed, which would reseed the random module, since set_state puts the words back in order
+        a_game = game.Game(list(record.words), code=code)
+        a_game.set_state(list(record.words), code)
+        a_game.verbose = False
+        n_turns = -1
+        for event in record.events:
+            kind, team = event["kind"], TEAMS[event["team"]]
+            if kind == CLUE:
+                n_turns += 1
+                a_game.curr_team = team
+                a_game.turns = n_turns
+                if turn is not None and n_turns == turn:
+                    break
+                a_game.state.give_clue((self.strings[event["b"]], int(event["a"])))
+            elif kind == GUESS:
+                card = int(event["a"])
+                rules.guess(a_game.board, a_game.state, card, record.words[card], thoughts[event["b"]])
+        return a_game
+
+    def stats(self):
+        """
+        Returns aggregate stats over every game, only looking at the events:
+            n_games, wins per team, assassin_rate: fraction of games where the assassin was revealed,
+            clues_by_n: n -> {"clues", "successes", "success_rate", "mean_correct"}, where a clue
+                succeeds when all n of its guesses were the team's.
+        """
+        wins = {"BLUE": 0, "RED": 0, None: 0}
+        n_assassin = 0
+        clues = {} # n -> [clues, successes, correct guesses]
+        for index in range(len(self)):
+            (winner, _, _, _, _), _, colors, events, _ = self._read(index)
+            wins[TEAMS[winner] if winner != NO_WINNER else None] += 1
+            real = events[(events["kind"] == CLUE) | (events["kind"] == GUESS)]
+            is_clue = real["kind"] == CLUE
+            guess_colors = np.where(is_clue, -1, colors[np.where(is_clue, 0, real["a"])].astype(np.int16))
+            n_assassin += bool((guess_colors == COLOR_IDS["ASSASIN"]).any())
+            # each clue owns the guesses up to the next clue
+            turn_of_event = np.cumsum(is_clue) - 1
+            clue_events = real[is_clue]
+            for turn, clue in enumerate(clue_events):
+                n, team = int(clue["a"]), int(clue["team"])
+                turn_colors = guess_colors[(turn_of_event == turn) & ~is_clue]
+                n_correct = int((turn_colors == team).sum())
+                counts = clues.setdefault(n, [0, 0, 0])
+                counts[0] += 1
+                counts[1] += n_correct >= n
+                counts[2] += n_correct
+        n_games = len(self)
+        return {
+            "n_games": n_games,
+            "wins": wins,
+            "assassin_rate": n_assassin / n_games if n_games else 0.0,
+            "clues_by_n": {n: {"clues": c, "successes": s, "success_rate": s / c, "mean_correct": correct / c}
+                           for n, (c, s, correct) in sorted(clues.items())},
+        }
+
+    def close(self):
+        # arrays handed out by game() are copies, so nothing points into the map any more
+        self.data.close()
+        self.file.close()
@@ -0,0 +1,177 @@
+"""
+Optional instrumentation of where a game spends its time.
+
+Nothing is recorded until start() is called. After that every LLM call, move (with its retries),
+round and game is appended to the active Recorder as an event, labeled with the game and round it
+happened in. Events can be rolled up per round or per game, and exported as JSONL or as a
+Prometheus style text dump. When recording is off each hook is a single None check.
+"""
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+_recorder = None # the active Recorder, None when instrumentation is off
+_labels = contextvars.ContextVar("metrics_labels", default={})
+_null_context = contextlib.nullcontext()
+
+SUMMED_FIELDS = ["llm_calls", "cached_calls", "seconds", "input_tokens", "output_tokens",
+                 "cache_creation_input_tokens", "cache_read_input_tokens", "parse_failures", "moves", "retries", "failed_moves",
+                 "memo_moves", "api_retries"]
+TOKEN_FIELDS = ["input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"]
+
+
+class Recorder():
+    def __init__(self):
+        self.events = []
+        self.phases = {} # phase name -> [times entered, seconds], see phase()
+        self._lock = threading.Lock()
+        self._n_games = 0
+
+    def new_game_id(self):
+        with self._lock:
+            self._n_games += 1
+            return self._n_games - 1
+
+    def record(self, kind, **fields):
+        event = {"kind": kind, **_labels.get(), **fields}
+        with self._lock:
+            self.events.append(event)
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            totals = self.phases.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def phase_table(self):
+        """Returns the phases as text, slowest first. Phases nest, so a guess includes the rendering it does."""
+        lines = [f"{'phase':>10} {'calls':>10} {'seconds':>10} {'us/call':>10}"]
+        for name, (n, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:>10} {n:>10} {seconds:>10.3f} {seconds / n * 1e6:>10.1f}")
+        return "\n".join(lines)
+
+    def rollup(self, by=("game", "round")):
+        """
+        Sums LLM calls, time, tokens, parse failures, API and move retries per group of events.
+        Args:
+            by: tuple of label names to group on, ("game", "round") for rounds or ("game",) for games.
+        Returns:
+            list of dicts, one per group, in the order the groups first appeared. Events without
+            all of the labels, like a game's own event when grouping by round, are left out.
+        """
+        groups = {}
+        for event in self.events:
+            if any(label not in event for label in by):
+                continue
+            key = tuple(event[label] for label in by)
+            if key not in groups:
+                groups[key] = {**dict(zip(by, key)), **{field: 0 for field in SUMMED_FIELDS}}
+            group = groups[key]
+            if event["kind"] == "llm_call":
+                group["llm_calls"] += 1
+                group["cached_calls"] += event["cached"]
+                group["seconds"] += event["seconds"]
+                for field in TOKEN_FIELDS:
+                    group[field] += event.get(field, 0)
+                group["parse_failures"] += not event["found_response"]
+                group["api_retries"] += event.get("api_retries", 0)
+            elif event["kind"] == "move":
+                group["moves"] += 1
+                group["retries"] += event["tries"] - 1
+                group["failed_moves"] += not event["success"]
+                group["memo_moves"] += event.get("memo", False) # replayed from a GuessMemo, no call made
+        return list(groups.values())
+
+    def to_jsonl(self, path, by=None):
+        """Writes the raw events, or their rollup if by is given, one JSON object per line."""
+        rows = self.events if by is None else self.rollup(by)
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+    def to_prometheus(self):
+        """Returns totals per agent role in the Prometheus text exposition format."""
+        totals = {}
+        for row in self.rollup(by=("role",)):
+            for field in SUMMED_FIELDS:
+                totals.setdefault(field, []).append((row["role"], row[field]))
+        lines = []
+        for field, values in totals.items():
+            name = f"codenames_{field}_total"
+            lines.append(f"# TYPE {name} counter")
+            for role, value in values:
+                lines.append(f'{name}{{role="{role}"}} {value}')
+        n_rounds = sum(1 for event in self.events if event["kind"] == "round")
+        n_games = sum(1 for event in self.events if event["kind"] == "game")
+        lines += ["# TYPE codenames_rounds_total counter", f"codenames_rounds_total {n_rounds}",
+                  "# TYPE codenames_games_total counter", f"codenames_games_total {n_games}"]
+        return "\n".join(lines) + "\n"
+
+
+def start():
+    """Starts recording into a new Recorder and returns it."""
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def stop():
+    """Stops recording and returns the Recorder that was active."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def active():
+    return _recorder
+
+
+def labels(**new_labels):
+    """Context manager adding labels to every event recorded inside it."""
+    if _recorder is None:
+        return _null_context
+    return _labeled(new_labels)
+
+
+@contextlib.contextmanager
+def _labeled(new_labels):
+    token = _labels.set({**_labels.get(), **new_labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def phase(name):
+    """Context manager adding the time spent inside it to the active Recorder's total for name.
+    The game times its "clue", "guess", "scoring" and "rendering" phases with it."""
+    if _recorder is None:
+        return _null_context
+    return _timed(_recorder, name)
+
+
+@contextlib.contextmanager
+def _timed(recorder, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_phase(name, time.perf_counter() - start)
+
+
+def record(kind, **fields):
+    if _recorder is not None:
+        _recorder.record(kind, **fields)
+
+
+def record_llm_call(start_time, response, found_response):
+    """Records a call that started at start_time. response is the backends.Completion, or None if
+    the answer came from a cache."""
+    if _recorder is None:
+        return
+    usage = getattr(response, "usage", None)
+    tokens = {field: getattr(usage, field, 0) or 0 for field in TOKEN_FIELDS}
+    _recorder.record("llm_call", seconds=time.perf_counter() - start_time, cached=response is None,
+                     found_response=found_response, api_retries=getattr(response, "api_retries", 0), **tokens)
@@ -0,0 +1,320 @@
+"""
+A local stand-in for the Anthropic messages endpoint, so agents can be run, timed and stressed
+offline. It can add latency, fail a fraction of requests, and rate limit with 429s. Blocks marked
+with cache_control are treated like prompt caching does, so usage reports cache reads and writes.
+It also serves the Message Batches endpoints, answering every request of a batch at once, and
+streams answers word by word as server-sent events when a request asks for stream.
+
+Point a backend at it with backends.AnthropicBackend(base_url=server.url, api_key="test").
+"""
+import collections
+import datetime
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_responder(request):
+    """
+    Answers well enough for a game to progress: the spymaster always clues one word, and the
+    guesser picks the first unguessed words on the board it was sent, as many as it was asked for.
+    """
+    content = request["messages"][-1]["content"]
+    message = content if isinstance(content, str) else "".join(block["text"] for block in content)
+    system = request.get("system", "")
+    if isinstance(system, list):
+        system = " ".join(block["text"] for block in system)
+    if "spymaster" in system:
+        return "Thinking about the board. <response>Zebra,1</response>"
+    unguessed = re.search(r"^Unguessed: (.+)$", message, re.MULTILINE)
+    words = unguessed.group(1).split(", ") if unguessed else ["EOT"]
+    # a guesser asked for a ranked list gets the first n words
+    ranked = re.search(r"^List up to (\d+) guesses", message, re.MULTILINE)
+    n = int(ranked.group(1)) if ranked else 1
+    return f"Thinking about the clue. <response>{','.join(words[:n])}</response>"
+
+
+def request_blocks(request):
+    """Returns the system and message text blocks of a request in the order the model reads them."""
+    system = request.get("system", [])
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+    blocks = list(system)
+    for message in request["messages"]:
+        content = message["content"]
+        blocks += [{"type": "text", "text": content}] if isinstance(content, str) else content
+    return blocks
+
+
+def message_json(text, request, usage=None):
+    if usage is None:
+        usage = {"input_tokens": len(json.dumps(request)) // 4}
+    return {
+        "id": "msg_local",
+        "type": "message",
+        "role": "assistant",
+        "model": request.get("model", "local"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {**usage, "output_tokens": len(text) // 4},
+    }
+
+
+def stream_events(payload):
+    """Returns the server-sent events streaming a message, one text delta per word."""
+    text = payload["content"][0]["text"]
+    start_usage = {**payload["usage"], "output_tokens": 1}
+    events = [("message_start", {"message": {**payload, "content": [], "stop_reason": None, "usage": start_usage}}),
+              ("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})]
+    for chunk in re.findall(r"\s*\S+", text):
+        events.append(("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": chunk}}))
+    events += [("content_block_stop", {"index": 0}),
+               ("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                  "usage": {"output_tokens": payload["usage"]["output_tokens"]}}),
+               ("message_stop", {})]
+    return [(name, {"type": name, **data}) for name, data in events]
+
+
+def scripted_responder(texts):
+    """Returns a responder that answers with texts in order, starting over when they run out."""
+    texts = itertools.cycle(texts)
+    lock = threading.Lock()
+    def responder(request):
+        with lock:
+            return next(texts)
+    return responder
+
+
+def error_json(error_type, message):
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+def timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+
+class MockServer():
+    def __init__(self, latency=0.0, responder=default_responder, error_rate=0.0, requests_per_minute=None,
+                 seed=None, host="127.0.0.1", port=0, batch_latency=0.0, word_delay=0.0):
+        """
+        Args:
+            latency: float, seconds every request waits before it is answered.
+            responder: function from the request JSON to the text of the answer, or a list of texts
+                to answer with in order.
+            error_rate: float, fraction of requests answered with a 529 overloaded error.
+            requests_per_minute: int, requests over this in the last minute get a 429.
+            seed: int, seeds which requests fail.
+            port: int, 0 picks a free port.
+            batch_latency: float, seconds a message batch stays in progress.
+            word_delay: float, seconds the model takes to write each word of an answer. Streamed
+                answers send each word as it is written, others wait for the whole answer.
+        """
+        self.latency = latency
+        if not callable(responder):
+            responder = scripted_responder(responder)
+        self.responder = responder
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_rate_limited = 0
+        self._request_times = collections.deque()
+        self._cached_prefixes = set()
+        self.batch_latency = batch_latency
+        self.word_delay = word_delay
+        self.n_streams_closed_early = 0
+        self.n_batches = 0
+        self._batches = {} # id -> (created time, list of results)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(body or b"{}")
+                status, payload = server.handle(self.path, request)
+                if status == 200 and request.get("stream"):
+                    self._stream(payload)
+                    return
+                if status == 200 and server.word_delay:
+                    time.sleep(server.word_delay * len(payload["content"][0]["text"].split()))
+                self._send(status, json.dumps(payload).encode("utf-8"))
+
+            def _stream(self, payload):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                try:
+                    for name, data in stream_events(payload):
+                        if name == "content_block_delta" and server.word_delay:
+                            time.sleep(server.word_delay)
+                        self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.n_streams_closed_early += 1
+
+            def do_GET(self):
+                status, payload = server.handle_get(self.path)
+                if isinstance(payload, str):
+                    self._send(status, payload.encode("utf-8"), "application/binary")
+                else:
+                    self._send(status, json.dumps(payload).encode("utf-8"))
+
+            def _send(self, status, data, content_type="application/json"):
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("retry-after", "1")
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def usage(self, request):
+        """Counts a request's input tokens like prompt caching would: the longest prefix ending at a
+        block with cache_control that an earlier request wrote is read from the cache, and the
+        prefix up to the last such block is written."""
+        blocks = request_blocks(request)
+        n_tokens = [len(block.get("text", "")) // 4 for block in blocks]
+        ends = [i + 1 for i, block in enumerate(blocks) if "cache_control" in block]
+        prefixes = [json.dumps(blocks[:end], sort_keys=True) for end in ends]
+        read = written = 0
+        with self._lock:
+            for end, prefix in zip(ends, prefixes):
+                if prefix in self._cached_prefixes:
+                    read = end
+            self._cached_prefixes.update(prefixes)
+        if ends:
+            written = max(ends[-1], read)
+        return {"input_tokens": sum(n_tokens[written:]),
+                "cache_creation_input_tokens": sum(n_tokens[read:written]),
+                "cache_read_input_tokens": sum(n_tokens[:read])}
+
+    def handle(self, path, request):
+        """Returns (status, JSON payload) for a request."""
+        if path.rstrip("/").endswith("/v1/messages/batches"):
+            return 200, self.create_batch(request)
+        now = time.monotonic()
+        with self._lock:
+            self.n_requests += 1
+            if self.requests_per_minute is not None:
+                while self._request_times and now - self._request_times[0] > 60:
+                    self._request_times.popleft()
+                if len(self._request_times) >= self.requests_per_minute:
+                    self.n_rate_limited += 1
+                    return 429, error_json("rate_limit_error", "Number of requests has exceeded your rate limit")
+                self._request_times.append(now)
+            failed = self._random.random() < self.error_rate
+            self.n_errors += failed
+        if self.latency:
+            time.sleep(self.latency)
+        if not path.rstrip("/").endswith("/v1/messages"):
+            return 404, error_json("not_found_error", path)
+        if failed:
+            return 529, error_json("overloaded_error", "Overloaded")
+        return 200, message_json(self.responder(request), request, self.usage(request))
+
+    def create_batch(self, request):
+        """Answers every request in the batch now. They are reported once batch_latency has passed."""
+        results = []
+        for entry in request["requests"]:
+            with self._lock:
+                failed = self._random.random() < self.error_rate
+                self.n_errors += failed
+            if failed:
+                result = {"type": "errored", "error": error_json("overloaded_error", "Overloaded")}
+            else:
+                params = entry["params"]
+                result = {"type": "succeeded", "message": message_json(self.responder(params), params, self.usage(params))}
+            results.append({"custom_id": entry["custom_id"], "result": result})
+        with self._lock:
+            batch_id = f"msgbatch_{self.n_batches}"
+            self.n_batches += 1
+            self.n_requests += len(results)
+            self._batches[batch_id] = (time.time(), results)
+        return self.batch_json(batch_id)
+
+    def batch_json(self, batch_id):
+        created, results = self._batches[batch_id]
+        ended = time.time() >= created + self.batch_latency
+        counts = {"processing": 0 if ended else len(results), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if ended:
+            for entry in results:
+                counts[entry["result"]["type"]] += 1
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": counts,
+            "created_at": timestamp(created),
+            "expires_at": timestamp(created + 24 * 60 * 60),
+            "ended_at": timestamp(created + self.batch_latency) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def handle_get(self, path):
+        """Returns (status, JSON payload or JSONL text) for a batch or its results."""
+        match = re.search(r"/v1/messages/batches/([^/?]+)(/results)?", path)
+        if match is None or match.group(1) not in self._batches:
+            return 404, error_json("not_found_error", path)
+        if match.group(2) is None:
+            return 200, self.batch_json(match.group(1))
+        return 200, "".join(json.dumps(entry) + "\n" for entry in self._batches[match.group(1)][1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--requests_per_minute", type=int, default=None)
+    parser.add_argument("--batch_latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockServer(latency=args.latency, error_rate=args.error_rate,
+                        requests_per_minute=args.requests_per_minute, port=args.port,
+                        batch_latency=args.batch_latency)
+    print(f"Serving a mock Anthropic API at {server.url}")
+    server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,91 @@
 import game
 import agents
-import words
+import cache
+import metrics
 import csv
 import argparse
-import tkinter as tk
-from tkinter import messagebox
-from tqdm import tqdm
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SpeculativeSpymaster(game.Spymaster):
+    def __init__(self, guesser, spymaster, rollout_attempts, team, rollout_workers=None):
+        """
+        Works out the AI team's next clue in the background while the human is still guessing.
+        Call start(a_game) whenever the board changes. It plays the rollouts and asks the spymaster
+        for a clue on a fork of the game, dropping any work started for an older board. play_round
+        then gives the clue at once if it is ready, or waits for the work in flight.
+        Args:
+            rollout_workers: int, the max_workers of Game.play_rollouts. A dropped job stops between
+                waves, so smaller waves stop sooner. Defaults to all rollouts in one wave.
+        """
+        self.guesser = guesser
+        self.spymaster = spymaster
+        self.rollout_attempts = rollout_attempts
+        self.rollout_workers = rollout_workers
+        self.team = team
+        # two workers, so a new board doesn't wait behind the model calls of a dropped one
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._job = None # (board key, future, cancelled event)
+        self._clue = None # handed out by the next get_move
+
+    @staticmethod
+    def _key(a_game):
+        # a move is the only thing that changes the board, and every move adds a guess or a clue
+        return a_game.state.guessed, a_game.clues
+
+    def start(self, a_game):
+        """Starts working out the clue for a_game's board, unless that is already underway."""
+        key = self._key(a_game)
+        if self._job is not None:
+            if self._job[0] == key:
+                return
+            self.cancel()
+        forked = a_game.fork()
+        cancelled = threading.Event()
+        self._job = (key, self._executor.submit(self._precompute, forked, cancelled), cancelled)
+
+    def cancel(self):
+        """Drops the work for the current board. The rollout in flight still finishes, but no
+        further rollout or model call is started."""
+        if self._job is not None:
+            _, future, cancelled = self._job
+            cancelled.set()
+            future.cancel()
+            self._job = None
+
+    def _precompute(self, forked, cancelled):
+        if cancelled.is_set():
+            return None
+        forked.play_rollouts(self.guesser, self.spymaster, self.rollout_attempts, override_curr_team=self.team,
+                             max_workers=self.rollout_workers, should_stop=cancelled.is_set)
+        if cancelled.is_set():
+            return None
+        forked.curr_team = self.team
+        return forked.rolled_back_results, self.spymaster.get_move(forked.get_spymaster_state())
+
+    def play_round(self, a_game, verbose=True):
+        """Plays the AI team's round with the precomputed clue. Returns like Game.play_one_round."""
+        self.start(a_game)
+        _, future, _ = self._job
+        self._job = None
+        rolled_back_results, self._clue = future.result()
+        a_game.rolled_back_results = list(rolled_back_results)
+        try:
+            return a_game.play_one_round(self.guesser, self, override_curr_team=self.team, verbose=verbose)
+        finally:
+            self._clue = None
+
+    def get_move(self, state):
+        if self._clue is not None:
+            clue, self._clue = self._clue, None
+            return clue
+        # the game turned the precomputed clue down, so ask again with its feedback
+        return self.spymaster.get_move(state)
+
+    def close(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
 
 
 def main():
@@ -14,13 +94,41 @@ def main():
                        help="Number of simulated attempts to run before making the real move. "
                             "Higher values let the AI spymaster try out different moves before "
                             "committing to one.")
+    parser.add_argument("--rollout_workers", type=int, default=None,
+                       help="Number of rollouts played at once. Each rollout of a wave asks for a "
+                            "different clue. Defaults to all of them at once.")
+    parser.add_argument("--cache", type=str, default=None,
+                       help="Path to an sqlite file caching model responses across runs.")
+    parser.add_argument("--replay", action="store_true",
+                       help="Only answer from the --cache file and never call the API.")
+    parser.add_argument("--search_seconds", type=float, default=None,
+                       help="Use a spymaster that asks the model for candidate clues once and picks one by "
+                            "simulating a local guesser for this many seconds, instead of rollouts. "
+                            "Needs the embeddings index, see embeddings.build_index.")
+    parser.add_argument("--metrics_path", type=str, default=None,
+                       help="Record the time, tokens and retries of every model call and write them "
+                            "to this JSONL file, one line per round, when the game ends.")
     args = parser.parse_args()
-    play_against_ai(args.rollout_attempts)
+    if args.metrics_path is not None:
+        metrics.start()
+    response_cache = None
+    if args.cache is not None:
+        response_cache = cache.ResponseCache(args.cache, mode="replay" if args.replay else "readwrite")
+    try:
+        play_against_ai(args.rollout_attempts, response_cache=response_cache, search_seconds=args.search_seconds,
+                        rollout_workers=args.rollout_workers)
+    finally:
+        if args.metrics_path is not None:
+            metrics.stop().to_jsonl(args.metrics_path, by=("game", "round"))
 
-def play_against_ai(rollout_attempts):
+def play_against_ai(rollout_attempts, response_cache=None, search_seconds=None, rollout_workers=None):
     SEED = 0
-    guesser = agents.AIGuesser()
-    spymaster = agents.AISpymaster()
+    guesser = agents.AIGuesser(cache=response_cache)
+    spymaster = agents.AISpymaster(cache=response_cache)
+    if search_seconds is not None:
+        import search # loads numpy and the embeddings index, so only when asked for
+        spymaster = search.SearchSpymaster(proposer=search.LLMProposer(cache=response_cache), time_budget=search_seconds)
+        rollout_attempts = 0
 
     # Ask user whether to read from file or enter manually
     choice = input("Would you like to (1) use default board or (2) enter board manually? Enter 1 or 2: ")
@@ -70,6 +178,8 @@ def play_against_ai(rollout_attempts):
             code_colors.append("NEUTRAL")
     code = {word: color for word, color in zip(words_list_entered, code_colors)}
     a_game = game.Game(words=words_list_entered, code=code, seed=SEED)
+    # the AI guesser answers at temperature 0, so rollouts of a clue already tried can reuse its guesses
+    a_game.guess_memo = game.GuessMemo()
     a_game.display(print_human_readable=True, show_code=True)
     _ = input("Above is the board. Each word is one of 4 colors: (Blue, Red, Yellow, Grey).\n"
               "Blue/Red are the words that the Blue/Red team is trying to guess.\n"
@@ -79,7 +189,10 @@ def play_against_ai(rollout_attempts):
               "team, or a neutral word, their turn ends.\nPress Enter to continue.")
     human_score, ai_score = 0, 0
     human_target, ai_target = code_colors.count(human_team), code_colors.count(ai_team)
+    # the AI works out its next clue while the human thinks
+    speculative = SpeculativeSpymaster(guesser, spymaster, rollout_attempts, ai_team, rollout_workers)
     while True:
+        speculative.start(a_game)
         get_input = input("Enter one of:\n"
                           "  a word from the board to make that guess from the human team\n"
                           f"  'c' to have the AI make its move. AI team is {ai_team}\n"
@@ -88,9 +201,9 @@ def play_against_ai(rollout_attempts):
         if get_input == "q":
             break
         elif get_input == "c":
-            for _ in tqdm(range(rollout_attempts), desc=f"AI is considering {rollout_attempts} moves."):
-                result = a_game.play_one_round(guesser, spymaster, rollback=True, override_curr_team=ai_team, verbose=False)
-            result = a_game.play_one_round(guesser, spymaster, override_curr_team=ai_team, verbose=True)
+            if rollout_attempts:
+                print(f"AI is considering {rollout_attempts} moves.")
+            result = speculative.play_round(a_game, verbose=True)
             print(result)
         else:
             guess = get_input
@@ -113,11 +226,16 @@ def play_against_ai(rollout_attempts):
         elif ai_score == ai_target:
             print(f"You lose! The AI guessed all {ai_target} words on the board.")
             break
-            
+    speculative.close()
+    print(f"Guesser calls saved by replaying earlier rollouts: {a_game.guess_memo.stats()}")
+
     print(a_game.display(print_human_readable=True, show_code=True))
     print(a_game.display(print_human_readable=True, show_code=False))
 
 def get_board_from_user():
+    # tkinter is missing on many headless installs, so it's only needed to enter a board by hand
+    import tkinter as tk
+
     # Create GUI window for word and code input
     input_window = tk.Tk()
     input_window.title("Codenames Board Setup")
@@ -0,0 +1,136 @@
+"""
+Finds where simulated games spend their time.
+
+profile_games plays games one after another in this process, with cProfile on only while a game
+is played and a StackSampler looking at the game's thread every few milliseconds. Across all the
+games it gives a table of the functions with the most time of their own, and the sampled stacks
+in the collapsed format that flamegraph.pl and speedscope read, one "outer;...;inner count" line
+per stack. metrics.phase totals for the clue, guess, scoring and rendering phases come with it.
+"""
+import collections
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+
+import numpy as np
+
+import game
+import metrics
+
+
+class StackSampler():
+    def __init__(self, interval=0.002, thread_id=None):
+        """
+        Counts the stacks a thread is in, looked at every interval seconds from a background thread.
+        Args:
+            thread_id: int, the thread to sample, defaults to the one calling start().
+        """
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = collections.Counter() # "outer;...;inner" -> number of samples
+        self.enabled = True # samples are only taken while this is set
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def frame_name(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def sample(self):
+        if not self.enabled:
+            return
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            names.append(self.frame_name(frame))
+            frame = frame.f_back
+        if names:
+            self.stacks[";".join(reversed(names))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Returns the stacks in the collapsed format, most sampled first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def hot_functions(stats, limit=25):
+    """Returns a table of the limit functions with the most time spent in themselves, from a pstats.Stats."""
+    rows = []
+    for (filename, line, name), (_, n_calls, own, cumulative, _) in stats.stats.items():
+        rows.append((own, cumulative, n_calls, f"{os.path.basename(filename)}:{line}({name})"))
+    rows.sort(reverse=True)
+    lines = [f"{'own s':>9} {'cum s':>9} {'calls':>10}  function"]
+    for own, cumulative, n_calls, function in rows[:limit]:
+        lines.append(f"{own:>9.3f} {cumulative:>9.3f} {n_calls:>10}  {function}")
+    return "\n".join(lines)
+
+
+def profile_games(guesser_factory, spymaster_factory, seeds, board_fn, max_turns=25, verbose=False,
+                  sample_interval=0.002):
+    """
+    Plays one game per seed in this process under cProfile and a StackSampler.
+    Args:
+        guesser_factory, spymaster_factory, board_fn: as in tournament.run_tournament.
+        verbose: bool, Game.verbose, so the cost of printing every move can be seen.
+    Returns:
+        (stats, sampler, recorder): the pstats.Stats summed over every game, the StackSampler, and
+        the metrics.Recorder holding the phase totals.
+    """
+    profiler = cProfile.Profile()
+    sampler = StackSampler(sample_interval)
+    sampler.enabled = False
+    metrics.start()
+    sampler.start()
+    try:
+        # the game prints every round, which would flood the terminal and isn't what we're timing
+        with contextlib.redirect_stdout(io.StringIO()):
+            for seed in seeds:
+                np.random.seed(seed)
+                word_list, code = board_fn(seed)
+                a_game = game.Game(word_list, code=code, seed=seed)
+                a_game.verbose = verbose
+                guesser, spymaster = guesser_factory(), spymaster_factory()
+                profiler.enable()
+                sampler.enabled = True
+                a_game.play(guesser, spymaster, max_turns=max_turns)
+                sampler.enabled = False
+                profiler.disable()
+    finally:
+        sampler.stop()
+        recorder = metrics.stop()
+    return pstats.Stats(profiler), sampler, recorder
+
+
+def write_profile(stats, sampler, recorder, path_prefix, limit=25):
+    """
+    Writes path_prefix.txt with the phase and hot function tables, path_prefix.collapsed with the
+    sampled stacks and path_prefix.prof with the raw cProfile stats for snakeviz or pstats.
+    Returns:
+        str, the tables written to path_prefix.txt.
+    """
+    report = recorder.phase_table() + "\n\n" + hot_functions(stats, limit)
+    with open(path_prefix + ".txt", "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    with open(path_prefix + ".collapsed", "w", encoding="utf-8") as f:
+        f.write(sampler.collapsed())
+    stats.dump_stats(path_prefix + ".prof")
+    return report
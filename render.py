@@ -0,0 +1,53 @@
+"""
+Turns boards into text, for models and for people. The rules in rules.py never call into this,
+so simulations don't pay for it. tabulate and colorama are only imported once something is
+printed, so headless runs never load them.
+"""
+from rules import COLORS
+
+ROW_LENGTH = 5
+
+
+def get_color(key):
+    """
+    Given either BLUE, RED, ASSASIN (yellow), or NEUTRAL (black), return the color code
+    """
+    from colorama import Fore
+    if key == "BLUE":
+        return Fore.BLUE
+    elif key == "RED":
+        return Fore.RED
+    elif key == "ASSASIN":
+        return Fore.YELLOW
+    elif key == "NEUTRAL":
+        return Fore.BLACK
+    else:
+        return Fore.WHITE
+
+
+def ai_board(board, state, show_code=False):
+    """Returns the board as a list of "Word (COLOR)", with (Unknown) for cards the guesser can't see."""
+    return [f"{word} ({COLORS[color]})" if show_code or state.is_guessed(card) else f"{word} (Unknown)"
+            for card, (word, color) in enumerate(zip(board.words, board.colors))]
+
+
+def print_board(board, state, show_code=False):
+    """Prints the board as a grid, coloring the cards that are revealed."""
+    import tabulate
+    from colorama import Style
+    rows = []
+    for start in range(0, len(board.words), ROW_LENGTH):
+        row = []
+        for card in range(start, min(start + ROW_LENGTH, len(board.words))):
+            word = board.words[card]
+            if show_code or state.is_guessed(card):
+                word = get_color(COLORS[board.colors[card]]) + word + Style.RESET_ALL
+            row.append(word)
+        rows.append(row)
+    print(tabulate.tabulate(rows, tablefmt="grid"))
+
+
+def announce(team, text):
+    """Prints a move in its team's color."""
+    from colorama import Fore, Style
+    print((Fore.BLUE if team == "BLUE" else Fore.RED) + text + Style.RESET_ALL)
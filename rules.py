@@ -0,0 +1,163 @@
+"""
+The rules of the game, with no printing, string parsing or agents.
+
+A Board fixes the words, a word <-> card id table and the color id of every card. A GameState
+holds the progress of one game on it. The functions below check and apply moves with card ids
+and color ids only, so simulations can call them in a loop without building any strings.
+render.py turns a board into text, and game.Game puts the two together for agents and people.
+"""
+from collections import namedtuple
+
+import constants
+
+COLORS = ("BLUE", "RED", "NEUTRAL", "ASSASIN")
+COLOR_IDS = {color: i for i, color in enumerate(COLORS)}
+BLUE, RED, NEUTRAL, ASSASIN = range(len(COLORS))
+TEAMS = ("BLUE", "RED")
+
+LOSE = "LOSE"
+HANDOVER = "handover"
+
+BoardConfig = namedtuple("BoardConfig", ["n_cards", "n_blue", "n_red", "n_assassin"],
+                         defaults=(constants.N_CARDS, constants.N_BLUE, constants.N_RED, 1))
+
+
+def default_config(n_cards):
+    """Returns the BoardConfig of a board of n_cards cards, with the blue and red counts of the
+    standard board scaled to its size and one assassin."""
+    return BoardConfig(n_cards, round(n_cards * constants.N_BLUE / constants.N_CARDS),
+                       round(n_cards * constants.N_RED / constants.N_CARDS))
+
+
+def color_counts(config):
+    """Returns the number of cards of each color, in COLORS order."""
+    n_neutral = config.n_cards - config.n_blue - config.n_red - config.n_assassin
+    if n_neutral < 0:
+        raise ValueError(f"{config} has more colored cards than cards")
+    return (config.n_blue, config.n_red, n_neutral, config.n_assassin)
+
+
+def generate_code(words, config=None):
+    """
+    Colors the words in order: first the blue ones, then red, neutral and the assassins.
+    Args:
+        config: BoardConfig, defaults to the standard color counts for a board of len(words) cards.
+    """
+    if config is None:
+        config = default_config(len(words))
+    if len(words) != config.n_cards:
+        raise ValueError(f"Got {len(words)} words for a board of {config.n_cards} cards")
+    code = {}
+    words = iter(words)
+    for color, count in zip(COLORS, color_counts(config)):
+        for _ in range(count):
+            code[next(words)] = color
+    return code
+
+
+class Board():
+    """The fixed part of a game: the words in the order the guesser sees them and their colors."""
+    __slots__ = ("words", "word_ids", "colors", "counts")
+
+    def __init__(self, words, code):
+        self.words = tuple(words)
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.colors = tuple(COLOR_IDS[code[word]] for word in self.words)
+        self.counts = tuple(self.colors.count(color) for color in range(len(COLORS)))
+
+
+class GameState():
+    """
+    The progress of a game, kept small and cheap to copy for search over rollouts. Cards are ids
+    into the board's word order, guessed cards are a bitmask and the logs are tuples, so every
+    field is immutable and a fork or snapshot only copies references.
+    """
+    __slots__ = ("guessed", "remaining", "guesses", "guesser_thoughts", "clues", "turns", "curr_team")
+
+    def __init__(self, remaining, curr_team="BLUE"):
+        """
+        Args:
+            remaining: tuple of the number of unguessed cards of each color, in COLORS order.
+        """
+        self.guessed = 0 # bit i is set when card i has been guessed
+        self.remaining = tuple(remaining)
+        self.guesses = () # words
+        self.guesser_thoughts = ()
+        self.clues = () # tuples of (word, number)
+        self.turns = 0
+        self.curr_team = curr_team
+
+    def is_guessed(self, card):
+        return self.guessed >> card & 1 == 1
+
+    def guess(self, card, color, word, thoughts):
+        """Marks card, of color id color, as guessed."""
+        self.guessed |= 1 << card
+        remaining = self.remaining
+        self.remaining = remaining[:color] + (remaining[color] - 1,) + remaining[color + 1:]
+        self.guesses += (word,)
+        self.guesser_thoughts += (thoughts,)
+
+    def give_clue(self, clue):
+        self.clues += (clue,)
+
+    def snapshot(self):
+        return (self.guessed, self.remaining, self.guesses, self.guesser_thoughts, self.clues, self.turns, self.curr_team)
+
+    def restore(self, snapshot):
+        (self.guessed, self.remaining, self.guesses, self.guesser_thoughts, self.clues, self.turns, self.curr_team) = snapshot
+
+    def fork(self):
+        """Returns an independent copy. Fields are immutable so nothing is copied until one side changes."""
+        forked = GameState.__new__(GameState)
+        forked.restore(self.snapshot())
+        return forked
+
+
+def new_state(board, curr_team="BLUE"):
+    return GameState(board.counts, curr_team)
+
+
+def guess(board, state, card, word="", thoughts=""):
+    """Reveals card. Returns its color id, or None if it had already been guessed."""
+    if state.guessed >> card & 1:
+        return None
+    color = board.colors[card]
+    state.guess(card, color, word, thoughts)
+    return color
+
+
+def clue_error(board, clue):
+    """Returns why a clue isn't allowed, or None if it is."""
+    if clue in board.word_ids:
+        return f"Word {clue} is already on the board. Pick a word not on the board."
+    elif " " in clue:
+        return f"Word {clue} contains a space. Pick a word without a space."
+    elif "-" in clue:
+        return f"Word {clue} contains a dash. Pick a word that isn't hyphonated"
+    return None
+
+
+def turn_result(color, team):
+    """Returns LOSE if the team revealed the assassin, HANDOVER if its turn is over, or None if it
+    can keep guessing after revealing a card of color id color."""
+    if color == ASSASIN:
+        return LOSE
+    elif color != team:
+        return HANDOVER
+    return None
+
+
+def other_team(team):
+    return TEAMS[1 - TEAMS.index(team)]
+
+
+def winner(state, team, round_response):
+    """Returns the winning team after a round played by team, or None if the game goes on. A team
+    wins once all its cards are revealed, whoever revealed them."""
+    if round_response == LOSE:
+        return other_team(team)
+    for a_team in TEAMS:
+        if state.remaining[COLOR_IDS[a_team]] == 0:
+            return a_team
+    return None
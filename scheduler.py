@@ -0,0 +1,232 @@
+"""
+Shares one model client between every agent and keeps it within rate limits.
+
+A Scheduler is an LLMBackend wrapping another backend. Before a call goes out it waits for room in
+a requests-per-minute and a tokens-per-minute token bucket, and for a free concurrency slot. Calls
+made for real moves go before calls made inside rollouts (Game.play_one_round with rollback=True).
+Rate limit, overloaded and connection errors are retried with jittered exponential backoff.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import backends
+import game
+
+MOVE_PRIORITY = 0
+ROLLOUT_PRIORITY = 1
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+class TokenBucket():
+    def __init__(self, per_minute):
+        """Holds up to a minute's worth of tokens, refilled continuously."""
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount can be taken, 0 if it can be taken now. Not thread safe on its own."""
+        self._refill()
+        # a request larger than the whole bucket goes through once the bucket is full
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+def is_retryable(error):
+    # only the SDK's errors are retried, and checking the module first keeps other errors, like a
+    # TraceBackend miss, from importing it
+    if not type(error).__module__.startswith("anthropic"):
+        return False
+    import anthropic
+    if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it did."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Scheduler(backends.LLMBackend):
+    def __init__(self, backend=None, requests_per_minute=None, tokens_per_minute=None, max_concurrency=None,
+                 max_retries=6, base_delay=0.5, max_delay=30.0, max_tokens=1024):
+        """
+        Args:
+            backend: LLMBackend to send calls to. Defaults to one AnthropicBackend, so every agent
+                using this scheduler shares its client's connection pool.
+            requests_per_minute, tokens_per_minute: int, budgets enforced with token buckets, None for no limit.
+                A call is charged its estimated input tokens plus max_tokens up front, and corrected
+                once the real usage is known.
+            max_concurrency: int, most calls in flight at once, None for no limit.
+            max_retries: int, retries for rate limit, overloaded and connection errors.
+        """
+        # retries are done here, where they can respect the rate limits, rather than in the client
+        self.backend = backend if backend is not None else backends.AnthropicBackend(max_retries=0, stop_at=backends.STOP_AT)
+        self.model = self.backend.model
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_tokens = max_tokens
+        self.in_flight = 0
+        self.n_retries = 0
+        self._waiting = [] # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+
+    def estimate_tokens(self, system_prompt, message, prefix=""):
+        return (len(system_prompt) + len(prefix) + len(message)) // 4 + self.max_tokens
+
+    def _try_admit(self, entry, n_tokens):
+        """Returns 0 if the call in entry may go now, otherwise how long to wait before trying again.
+        Must hold self._condition."""
+        if self._waiting[0] != entry:
+            return self.max_delay
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            return self.max_delay
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(n_tokens))
+        if wait > 0:
+            return wait
+        heapq.heappop(self._waiting)
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(n_tokens)
+        self.in_flight += 1
+        # the next caller in line may be able to go as well
+        self._condition.notify_all()
+        return 0.0
+
+    def _enqueue(self):
+        priority = ROLLOUT_PRIORITY if game.in_rollout.get() else MOVE_PRIORITY
+        entry = (priority, next(self._tickets))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _abandon(self, entry):
+        """Takes a call that stopped waiting, e.g. because it was cancelled, out of the line, so the
+        calls behind it aren't stuck waiting for it to go first."""
+        with self._condition:
+            if entry in self._waiting:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def _acquire(self, n_tokens):
+        entry = self._enqueue()
+        try:
+            with self._condition:
+                while True:
+                    wait = self._try_admit(entry, n_tokens)
+                    if wait == 0:
+                        return
+                    self._condition.wait(wait)
+        except BaseException:
+            self._abandon(entry)
+            raise
+
+    async def _acquire_async(self, n_tokens):
+        entry = self._enqueue()
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(entry, n_tokens)
+                if wait == 0:
+                    return
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            self._abandon(entry)
+            raise
+
+    def _release(self, estimated_tokens, completion):
+        with self._condition:
+            self.in_flight -= 1
+            if self.tokens is not None and completion is not None:
+                used = completion.usage.input_tokens + completion.usage.output_tokens
+                self.tokens.take(used - estimated_tokens)
+            self._condition.notify_all()
+
+    def _backoff(self, attempt, error):
+        self.n_retries += 1
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        # full jitter so callers that failed together don't retry together
+        return random.uniform(0, delay)
+
+    def complete(self, system_prompt, message, prefix=""):
+        n_tokens = self.estimate_tokens(system_prompt, message, prefix)
+        for attempt in itertools.count():
+            self._acquire(n_tokens)
+            completion = None
+            try:
+                completion = self.backend.complete(system_prompt, message, prefix)
+                return completion._replace(api_retries=attempt)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                delay = self._backoff(attempt, error)
+            finally:
+                self._release(n_tokens, completion)
+            time.sleep(delay)
+
+    async def complete_async(self, system_prompt, message, prefix=""):
+        n_tokens = self.estimate_tokens(system_prompt, message, prefix)
+        for attempt in itertools.count():
+            await self._acquire_async(n_tokens)
+            completion = None
+            try:
+                completion = await self.backend.complete_async(system_prompt, message, prefix)
+                return completion._replace(api_retries=attempt)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                delay = self._backoff(attempt, error)
+            finally:
+                self._release(n_tokens, completion)
+            await asyncio.sleep(delay)
+
+
+def configure(**kwargs):
+    """Replaces the shared scheduler with one built from kwargs, see Scheduler."""
+    global _shared
+    with _shared_lock:
+        _shared = Scheduler(**kwargs)
+    return _shared
+
+
+def shared():
+    """Returns the process wide scheduler the AI agents use by default."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Scheduler()
+        return _shared
@@ -0,0 +1,159 @@
+"""
+A spymaster that searches over candidate clues instead of trusting its first idea.
+
+Candidates come from the embedding index or from one LLM call. Each one is scored by simulating
+many turns of a cheap local guesser model, which ranks the unguessed words by their embedding
+similarity to the clue plus noise, and plays them with the same turn rules as Game.play_one_round.
+The clue with the most expected cards gained, minus the risk of what ends the turn, is given.
+Simulations run in rounds across threads until the move's time budget is spent.
+"""
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import agents
+from embeddings import EmbeddingSpymaster, WordEmbeddings
+from game import Spymaster, COLOR_IDS
+
+
+def simulate_turns(similarities, colors, team, n, n_rollouts, rng, noise=0.1, threshold=0.2):
+    """
+    Plays n_rollouts turns of the local guesser model on one clue, all at once.
+    Args:
+        similarities: (n_words,) similarity of each unguessed word to the clue.
+        colors: (n_words,) color id of each unguessed word, see game.COLOR_IDS.
+        team: int, color id of the team guessing.
+        n: int, number of words the clue is for, the most guesses the turn can have.
+        noise: float, standard deviation of the noise added to the similarities in each rollout.
+        threshold: float, the guesser ends the turn rather than guess a word scoring below this.
+    Returns:
+        (gained, ended_by): (n_rollouts,) arrays of team cards revealed, and the color id of the
+        card that ended the turn, -1 if the turn ended without a wrong guess.
+    """
+    n = min(n, len(similarities))
+    scores = similarities[None, :] + rng.normal(0.0, noise, (n_rollouts, len(similarities))).astype(np.float32)
+    picks = np.argsort(-scores, axis=1)[:, :n]
+    # a guess is only made if every higher ranked guess was made too
+    guessed = np.cumprod(np.take_along_axis(scores, picks, axis=1) >= threshold, axis=1).astype(bool)
+    picked_colors = colors[picks]
+    wrong = guessed & (picked_colors != team)
+    any_wrong = wrong.any(axis=1)
+    first_wrong = np.where(any_wrong, wrong.argmax(axis=1), n)
+    gained = (guessed & (np.arange(n)[None, :] < first_wrong[:, None])).sum(axis=1)
+    ended_by = np.where(any_wrong, picked_colors[np.arange(n_rollouts), np.minimum(first_wrong, n - 1)], -1)
+    return gained, ended_by
+
+
+class EmbeddingProposer():
+    def __init__(self, spymaster):
+        """Proposes the best clues of an EmbeddingSpymaster, each for every number up to its own."""
+        self.spymaster = spymaster
+
+    def propose(self, state, k):
+        n, score = self.spymaster.score_clues(state)
+        best = np.argsort(-score, kind="stable")[:k]
+        vocab = self.spymaster.embeddings.vocab
+        return [(vocab[i].capitalize(), count) for i in best if np.isfinite(score[i]) for count in range(1, int(n[i]) + 1)]
+
+
+class LLMProposer():
+    def __init__(self, backend=None, cache=None):
+        """Asks the model for several clues in one call."""
+        self.spymaster = agents.AISpymaster(backend=backend, cache=cache)
+        self.spymaster.system_prompt += """
+        Instead of one clue, give several different clues separated by semicolons, like <response>Word,2;Other,1</response>.
+        """
+
+    def propose(self, state, k):
+        message = self.spymaster.get_message(state) + f"\nGive {k} clues."
+        success, response, _ = agents.get_anthropic_answer(self.spymaster.backend, self.spymaster.system_prompt, message,
+                                                           cache=self.spymaster.cache, prefix=self.spymaster.get_prefix(state))
+        candidates = []
+        for clue in response.split(";")[:k]:
+            word, _, n = clue.partition(",")
+            if n.strip().isdigit():
+                candidates.append((word.strip(), int(n)))
+        return candidates
+
+
+class SearchSpymaster(Spymaster):
+    def __init__(self, embeddings=None, proposer=None, n_candidates=10, time_budget=1.0, max_rollouts=5000,
+                 rollouts_per_task=500, max_workers=None, noise=0.1, threshold=0.2,
+                 opponent_cost=1.0, neutral_cost=0.25, assassin_cost=10.0, seed=None):
+        """
+        Args:
+            embeddings: WordEmbeddings for the guesser model, defaults to the one at embeddings.INDEX_PATH.
+            proposer: object with propose(state, k) returning candidate (clue, n) pairs. Defaults to
+                an EmbeddingProposer.
+            n_candidates: int, k passed to the proposer.
+            time_budget: float, seconds of simulation per move. At least one round is always simulated.
+            max_rollouts: int, simulations per candidate after which the search stops early.
+            rollouts_per_task: int, simulations of one candidate per task handed to a thread.
+            opponent_cost, neutral_cost, assassin_cost: float, taken off a clue's value, in cards,
+                times the chance its turn ends on that color. Revealing the assassin loses the game,
+                so it costs the most.
+        """
+        super().__init__()
+        self.embeddings = embeddings if embeddings is not None else WordEmbeddings()
+        self.proposer = proposer if proposer is not None else EmbeddingProposer(EmbeddingSpymaster(self.embeddings))
+        self.n_candidates = n_candidates
+        self.time_budget = time_budget
+        self.max_rollouts = max_rollouts
+        self.rollouts_per_task = rollouts_per_task
+        self.max_workers = max_workers or os.cpu_count()
+        self.noise = noise
+        self.threshold = threshold
+        self.costs = {COLOR_IDS["RED"]: opponent_cost, COLOR_IDS["BLUE"]: opponent_cost,
+                      COLOR_IDS["NEUTRAL"]: neutral_cost, COLOR_IDS["ASSASIN"]: assassin_cost}
+        self.seed = seed
+        self._moves = itertools.count()
+        self.last_search = [] # (clue, n, value, n_rollouts) of the last move, best first
+
+    def is_valid(self, clue, state):
+        """Whether the game would accept the clue and the guesser model knows it."""
+        return (clue not in state.code and " " not in clue and "-" not in clue and clue in self.embeddings
+                and not any(clue.lower() in word.lower() or word.lower() in clue.lower() for word in state.words))
+
+    def evaluate(self, candidates, state):
+        """Returns the value and number of rollouts of each candidate."""
+        words = [word for word in state.words if word not in state.guesses]
+        colors = np.array([COLOR_IDS[state.code[word]] for word in words])
+        team = COLOR_IDS[state.curr_team]
+        clue_vectors = self.embeddings.vectors([clue for clue, _ in candidates])
+        similarities = clue_vectors @ self.embeddings.vectors(words).T
+        costs = np.zeros(len(COLOR_IDS) + 1)
+        for color, cost in self.costs.items():
+            if color != team:
+                costs[color] = cost
+
+        totals = np.zeros(len(candidates))
+        n_rollouts = 0
+        move = next(self._moves)
+        deadline = time.perf_counter() + self.time_budget
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for round_index in itertools.count():
+                def simulate(i):
+                    rng = np.random.default_rng(None if self.seed is None else [self.seed, move, round_index, i])
+                    gained, ended_by = simulate_turns(similarities[i], colors, team, candidates[i][1],
+                                                      self.rollouts_per_task, rng, self.noise, self.threshold)
+                    # ended_by is -1 when nothing went wrong, which picks the last cost, 0
+                    return gained.sum() - costs[ended_by].sum()
+                totals += list(executor.map(simulate, range(len(candidates))))
+                n_rollouts += self.rollouts_per_task
+                if n_rollouts >= self.max_rollouts or time.perf_counter() >= deadline:
+                    break
+        return totals / n_rollouts, n_rollouts
+
+    def get_move(self, state):
+        candidates = [(clue, n) for clue, n in self.proposer.propose(state, self.n_candidates)
+                      if n >= 1 and self.is_valid(clue, state)]
+        if not candidates:
+            # nothing we can simulate, so fall back to the embedding spymaster's own pick
+            return EmbeddingSpymaster(self.embeddings).get_move(state)
+        values, n_rollouts = self.evaluate(candidates, state)
+        order = np.argsort(-values, kind="stable")
+        self.last_search = [(*candidates[i], float(values[i]), n_rollouts) for i in order]
+        return candidates[order[0]]
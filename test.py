@@ -2,9 +2,53 @@ import game
 import words
 import agents
 import constants
+import cache
+import tournament
+import batch_sim
+import embeddings
+import numpy as np
+import metrics
+import benchmark
+import backends
+import mock_server
+import scheduler
+import batch_play
+import search
+import rules
+import gamelog
+import play
+import profiling
+import types
+import csv
+import asyncio
+import time
+import random
 
 SEED = 123
 
+def load_default_board():
+    """Returns the words and code from board.csv, which doesn't need the wordlist submodule."""
+    with open("board.csv", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    colors = {"b": "BLUE", "r": "RED", "y": "ASSASIN", "n": "NEUTRAL"}
+    return rows[0], {word: colors[c] for word, c in zip(rows[0], rows[1])}
+
+class FakeClient():
+    """Stands in for anthropic.Anthropic and counts how many calls are made."""
+    def __init__(self, answer="<response>Tree</response>"):
+        self.answer = answer
+        self.n_calls = 0
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.n_calls += 1
+        return types.SimpleNamespace(content=[types.SimpleNamespace(text=self.answer)])
+
+class FakeAsyncClient(FakeClient):
+    """Stands in for anthropic.AsyncAnthropic."""
+    async def create(self, **kwargs):
+        return FakeClient.create(self, **kwargs)
+
 def test_display():
     word_list = words.main(25, seed=SEED)
     print(word_list)
@@ -37,16 +81,8 @@ def test_play():
     print(f"winner: {winner}")
 
 def test_get_win_stats(n_games=100):
-    word_list = words.main(25)
-    win_stats = {"BLUE": 0, "RED": 0}
-    for _ in range(n_games):
-        guesser = agents.RandomGuesser()
-        spymaster = agents.RandomSpymaster()
-        a_game = game.Game(word_list)
-        winner = a_game.play(guesser, spymaster)
-        win_stats[winner] += 1
-    print(f"win stats: {win_stats}")
-
+    summary = tournament.run_tournament(agents.RandomGuesser, agents.RandomSpymaster, n_boards=n_games)
+    print(f"win stats: {summary}")
 
 def test_play_one_round_ai():
     guesser = agents.AIGuesser()
@@ -132,6 +168,619 @@ def test_prompts_ai_battle():
     print(a_game.display(print_human_readable=True, show_code=False))
     print(a_game.get_score())
 
+def test_response_cache(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    client = FakeClient()
+    response_cache = cache.ResponseCache(path, max_entries=2)
+    for _ in range(3):
+        found, response, _ = agents.get_anthropic_answer(client, "system", "msg 1", cache=response_cache)
+        assert found and response == "Tree"
+    assert client.n_calls == 1
+    assert response_cache.stats()["hits"] == 2
+    agents.get_anthropic_answer(client, "system", "msg 2", cache=response_cache)
+    agents.get_anthropic_answer(client, "system", "msg 1", cache=response_cache)
+    agents.get_anthropic_answer(client, "system", "msg 3", cache=response_cache)
+    # msg 2 was least recently used so it got evicted
+    assert len(response_cache) == 2
+    assert response_cache.get(agents.MODEL, "system", "msg 2") is None
+    response_cache.close()
+
+    replay_cache = cache.ResponseCache(path, mode="replay")
+    agents.get_anthropic_answer(client, "system", "msg 3", cache=replay_cache)
+    assert client.n_calls == 3
+    try:
+        agents.get_anthropic_answer(client, "system", "never seen", cache=replay_cache)
+        assert False, "replay mode should not fall back to the client"
+    except cache.CacheMiss:
+        pass
+    assert replay_cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+def test_play_rollouts():
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    results = a_game.play_rollouts(agents.RandomGuesser(), agents.RandomSpymaster(), 4, override_curr_team="BLUE")
+    assert len(results) == 4 and len(a_game.rolled_back_results) == 4
+    # every rollout started from the same untouched state
+    assert a_game.guesses == () and a_game.clues == ()
+    assert all(rolled_back[1] == [a_game.words[0]] for rolled_back in a_game.rolled_back_results)
+    # rollouts in a wave ask for different clues, and each wave sees the ones before it
+    class RecordingSpymaster(game.Spymaster):
+        def __init__(self):
+            self.seen = []
+        def get_move(self, state):
+            self.seen.append((len(state.rolled_back_results), state.rollout_rank))
+            return f"Clue{state.rollout_rank}", 1
+    spymaster = RecordingSpymaster()
+    a_game.rolled_back_results = []
+    a_game.play_rollouts(agents.RandomGuesser(), spymaster, 4, override_curr_team="BLUE", max_workers=2)
+    assert sorted(spymaster.seen) == [(0, 0), (0, 1), (2, 0), (2, 1)]
+    assert [rolled_back[0][0] for rolled_back in a_game.rolled_back_results] == ["Clue0", "Clue1"] * 2
+    message = agents.AISpymaster(backend=FakeClient()).get_message(a_game.get_spymaster_state())
+    assert "rank number" not in message
+    forked = a_game.fork()
+    forked.rollout_rank = 1
+    assert "rank number 2" in agents.AISpymaster(backend=FakeClient()).get_message(forked.get_spymaster_state())
+
+def test_play_async():
+    word_list, code = load_default_board()
+    sync_game = game.Game(list(word_list), code=code, seed=SEED)
+    sync_winner = sync_game.play(agents.RandomGuesser(), agents.RandomSpymaster())
+
+    async def play_many(n_games):
+        games = [game.Game(list(word_list), code=code, seed=SEED) for _ in range(n_games)]
+        return await asyncio.gather(*(a_game.play_async(agents.RandomGuesser(), agents.RandomSpymaster()) for a_game in games))
+    assert asyncio.run(play_many(20)) == [sync_winner] * 20
+
+def test_ai_guesser_async():
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.give_clue(("Doctor", 1))
+    guesser = agents.AIGuesser(backend=backends.AnthropicBackend(async_client=FakeAsyncClient(answer="thinking <response>Ambulance</response>")))
+    guess, thoughts = asyncio.run(guesser.get_move_async(a_game.get_guesser_state()))
+    assert guess == "Ambulance" and thoughts.startswith("thinking")
+
+def default_board_for_seed(seed):
+    """board.csv for every seed, Game still shuffles it by seed."""
+    return load_default_board()
+
+def test_tournament_resume(tmp_path):
+    results_path = str(tmp_path / "results.jsonl")
+    summary = tournament.run_tournament(agents.RandomGuesser, agents.RandomSpymaster, n_boards=6,
+                                        board_fn=default_board_for_seed, max_workers=2, results_path=results_path)
+    assert summary["n_games"] == 6 and sum(summary["wins"].values()) == 6
+    low, high = summary["confidence_interval"]["BLUE"]
+    assert 0 <= low <= summary["win_rate"]["BLUE"] <= high <= 1
+    # a rerun with more boards only plays the new seeds
+    summary = tournament.run_tournament(agents.RandomGuesser, agents.RandomSpymaster, n_boards=10,
+                                        board_fn=default_board_for_seed, max_workers=2, results_path=results_path)
+    assert summary["n_games"] == 10
+    assert len(tournament.load_results(results_path)) == 10
+    # a line cut short by a crash is dropped before new results are appended
+    with open(results_path, "a", encoding="utf-8") as f:
+        f.write('{"seed": 10, "win')
+    for _ in range(2):
+        summary = tournament.run_tournament(agents.RandomGuesser, agents.RandomSpymaster, n_boards=12,
+                                            board_fn=default_board_for_seed, max_workers=2, results_path=results_path)
+    assert summary["n_games"] == 12 and summary["games_per_second"] == 0
+    with open(results_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == len(tournament.load_results(results_path)) == 12
+
+def test_batch_sim_matches_game(n_games=50):
+    seeds = list(range(n_games))
+    winners = []
+    for seed in seeds:
+        a_game = game.Game([f"Card{i}" for i in range(25)], seed=seed)
+        winners.append(a_game.play(agents.RandomGuesser(), agents.RandomSpymaster()))
+    batch_winners = batch_sim.BatchGames.from_seeds(seeds).run()
+    assert [batch_sim.TEAMS[w] if w != batch_sim.NO_WINNER else None for w in batch_winners] == winners
+    stats = batch_sim.simulate(10_000, policy="random")
+    assert sum(stats.values()) == 10_000 and stats[None] == 0
+
+def test_incremental_board_state():
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    board = a_game.display()
+    assert a_game.display() is board
+    blue_words = [word for word in a_game.words if code[word] == "BLUE"]
+    assert a_game.guess_word([blue_words[0], ""]) == (True, "BLUE")
+    assert a_game.get_score() == {"BLUE": 1, "RED": 0}
+    assert f"{blue_words[0]} (BLUE)" in a_game.display() and a_game.display() is not board
+    assert a_game.guess_word([blue_words[0], ""])[0] is False
+    board = a_game.display()
+    round_start = a_game._start_round(None, False)
+    a_game.give_clue(("Clue", 1))
+    a_game.guess_word([blue_words[1], ""])
+    assert a_game.get_score() == {"BLUE": 2, "RED": 0}
+    a_game._end_round(True, 1, None, round_start)
+    assert a_game.rolled_back_results[-1][:2] == (("Clue", 1), [blue_words[1]])
+    assert a_game.get_score() == {"BLUE": 1, "RED": 0} and a_game.display() == board
+
+def test_game_state_fork():
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    a_game.guess_word([a_game.words[0], "first"])
+    snapshot = a_game.snapshot()
+    forked = a_game.fork()
+    forked.guess_word([a_game.words[1], "second"])
+    assert a_game.guesses == (a_game.words[0],) and len(forked.guesses) == 2
+    a_game.guess_word([a_game.words[2], "third"])
+    a_game.turns += 1
+    a_game.restore(snapshot)
+    assert a_game.guesses == (a_game.words[0],) and a_game.turns == 0
+    assert sum(a_game.remaining.values()) == 24 and sum(forked.remaining.values()) == 23
+
+def make_embeddings(tmp_path, word_list, code):
+    """Builds a tiny index where each color's words share a direction, and "animal" points at the BLUE one."""
+    directions = {"BLUE": 0, "RED": 1, "NEUTRAL": 2, "ASSASIN": 3}
+    lines = []
+    for word in word_list:
+        vector = [0.1] * 6
+        vector[directions[code[word]]] = 1.0
+        vector[4 + len(word) % 2] = 0.3
+        lines.append(word.lower() + " " + " ".join(map(str, vector)))
+    lines.append("animal 1.0 0 0 0 0.1 0.1")
+    lines.append("engine 0 1.0 0 0 0.1 0.1")
+    lines.append("pilots 1.0 0 0 0 0.1 0.1") # contains the board word pilot, so never a clue
+    vectors_path = tmp_path / "vectors.txt"
+    vectors_path.write_text("\n".join(lines), encoding="utf-8")
+    index_path = str(tmp_path / "index.npy")
+    embeddings.build_index(str(vectors_path), index_path)
+    return embeddings.WordEmbeddings(index_path)
+
+def test_embedding_spymaster(tmp_path):
+    word_list, code = load_default_board()
+    code["Pilot"] = "BLUE"
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    spymaster = embeddings.EmbeddingSpymaster(make_embeddings(tmp_path, word_list, code))
+    clue, n = spymaster.get_move(a_game.get_spymaster_state())
+    assert (clue, n) == ("Animal", 4)
+    assert a_game.give_clue((clue, n))[0]
+    a_game.curr_team = "RED"
+    assert spymaster.get_move(a_game.get_spymaster_state())[0] == "Engine"
+
+def test_embedding_guesser(tmp_path):
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    local_embeddings = make_embeddings(tmp_path, word_list, code)
+    guesser = embeddings.EmbeddingGuesser(local_embeddings, threshold=0.5)
+    a_game.curr_team = "RED"
+    spymaster = embeddings.EmbeddingSpymaster(local_embeddings)
+    n_guesses_made, round_response = a_game.play_one_round(guesser, spymaster, verbose=False)
+    assert a_game.clues[-1][0] == "Engine"
+    assert all(code[word] == "RED" for word in a_game.guesses) and n_guesses_made == a_game.clues[-1][1]
+    a_game.give_clue(("Unknownword", 2))
+    assert guesser.get_move(a_game.get_guesser_state())[0] == constants.END_OF_TURN
+
+def test_sample_boards(tmp_path):
+    wordlist_path = tmp_path / "wordlist.txt"
+    wordlist_path.write_text("\n".join(f"Word{i % 40}" for i in range(60)) + "\n", encoding="utf-8")
+    assert len(words.load_words(str(wordlist_path))) == 40
+    state_before = np.random.get_state()[1].copy()
+    boards = list(words.sample_boards(10, seed=SEED, path=str(wordlist_path), chunk_size=3))
+    assert len(boards) == 10
+    for board, code in boards:
+        assert len(set(board)) == 25 and set(code) == set(board)
+        assert list(code.values()).count("BLUE") == constants.N_BLUE
+    assert boards == list(words.sample_boards(10, seed=SEED, path=str(wordlist_path)))
+    assert list(words.main(25, seed=SEED, path=str(wordlist_path))) == list(words.main(25, seed=SEED, path=str(wordlist_path)))
+    assert (np.random.get_state()[1] == state_before).all()
+
+class InvalidFirstGuesser(agents.RandomGuesser):
+    """Guesses a word that isn't on the board before every real guess."""
+    def get_move(self, state):
+        if state.game_response == "":
+            return "Notaword", ""
+        return super().get_move(state)
+
+def test_metrics(tmp_path):
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    spymaster = agents.AISpymaster(backend=backends.AnthropicBackend(client=FakeClient(answer="<response>Zebra,1</response>")))
+    recorder = metrics.start()
+    try:
+        winner = a_game.play(InvalidFirstGuesser(), spymaster)
+    finally:
+        assert metrics.stop() is recorder
+    rounds = recorder.rollup(by=("game", "round"))
+    assert len(rounds) == a_game.turns + 1
+    assert all(row["llm_calls"] == 1 and row["moves"] == 2 and row["retries"] == 1 for row in rounds)
+    games = recorder.rollup(by=("game",))
+    assert len(games) == 1 and games[0]["parse_failures"] == 0
+    assert recorder.events[-1] == {"kind": "game", "game": 0, "winner": winner, "turns": a_game.turns}
+    recorder.to_jsonl(str(tmp_path / "rounds.jsonl"), by=("game", "round"))
+    assert len((tmp_path / "rounds.jsonl").read_text().splitlines()) == len(rounds)
+    assert f'codenames_llm_calls_total{{role="spymaster"}} {len(rounds)}' in recorder.to_prometheus()
+    # once stopped nothing is recorded
+    a_game.play_one_round(agents.RandomGuesser(), agents.RandomSpymaster(), rollback=True, verbose=False)
+    assert len(recorder.events) == len(rounds) * 4 + 1
+    # rollouts played on forks before the first real round count towards the same game
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    recorder = metrics.start()
+    try:
+        a_game.play_rollouts(agents.RandomGuesser(), agents.RandomSpymaster(), 3)
+        a_game.play_one_round(agents.RandomGuesser(), agents.RandomSpymaster(), verbose=False)
+    finally:
+        metrics.stop()
+    assert [row["game"] for row in recorder.rollup(by=("game",))] == [0]
+
+def test_benchmark():
+    results = benchmark.run(min_seconds=0.01)
+    assert {"game_display", "game_get_score", "play_one_round", "game_play", "ai_play_one_round"} <= set(results)
+    assert all(ops > 0 for ops in results.values())
+    baseline = {name: ops * 2 for name, ops in results.items()}
+    assert benchmark.compare(results, baseline, threshold=0.2) == list(results)
+    assert benchmark.compare(results, baseline, threshold=0.6) == []
+
+def test_backends(tmp_path):
+    trace_path = str(tmp_path / "trace.jsonl")
+    with mock_server.MockServer(responder=["<response>Tree</response>", "<response>Rock</response>"]) as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0)
+        recording = backends.RecordingBackend(backend, trace_path)
+        assert agents.get_anthropic_answer(recording, "system", "msg 1")[1] == "Tree"
+        assert asyncio.run(agents.get_anthropic_answer_async(recording, "system", "msg 2"))[1] == "Rock"
+    replay = backends.TraceBackend(trace_path)
+    assert agents.get_anthropic_answer(replay, "system", "msg 2")[1] == "Rock"
+    assert replay.complete("system", "msg 1").usage.output_tokens > 0
+    try:
+        replay.complete("system", "never seen")
+        assert False, "unrecorded prompts should raise"
+    except KeyError:
+        pass
+
+def test_mock_server_errors():
+    import anthropic
+    with mock_server.MockServer(requests_per_minute=2) as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0)
+        backend.complete("system", "msg")
+        backend.complete("system", "msg")
+        try:
+            backend.complete("system", "msg")
+            assert False, "third request in a minute should be rate limited"
+        except anthropic.RateLimitError:
+            pass
+        assert server.n_rate_limited == 1
+    with mock_server.MockServer(error_rate=1.0) as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0)
+        try:
+            backend.complete("system", "msg")
+            assert False, "every request should fail"
+        except anthropic.APIStatusError as error:
+            assert error.status_code == 529
+
+def test_scheduler_retries():
+    with mock_server.MockServer(error_rate=0.3, seed=SEED) as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0)
+        llm = scheduler.Scheduler(backend, requests_per_minute=6000, max_concurrency=2,
+                                  max_retries=10, base_delay=0.01)
+        for i in range(6):
+            assert llm.complete("system", f"msg {i}").text.endswith("</response>")
+        assert asyncio.run(llm.complete_async("system", "msg")).usage.output_tokens > 0
+        assert llm.n_retries == server.n_errors > 0
+        assert llm.in_flight == 0
+        # each call's retries reach its llm_call event
+        n_retries = llm.n_retries
+        recorder = metrics.start()
+        try:
+            for i in range(6):
+                agents.get_anthropic_answer(llm, "system", f"msg {i}")
+        finally:
+            metrics.stop()
+        [row] = recorder.rollup(by=())
+        assert row["llm_calls"] == 6 and row["api_retries"] == llm.n_retries - n_retries > 0
+    # a call cancelled while it waits its turn leaves the line
+    llm = scheduler.Scheduler(backends.as_backend(FakeClient()), requests_per_minute=60)
+    llm.requests.take(60)
+    async def cancel_waiting_call():
+        task = asyncio.create_task(llm.complete_async("system", "msg"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    asyncio.run(cancel_waiting_call())
+    assert llm._waiting == []
+    assert not scheduler.is_retryable(KeyError("not in the trace"))
+    bucket = scheduler.TokenBucket(60)
+    assert bucket.wait_time(60) == 0
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1
+
+def test_prompt_caching():
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    with mock_server.MockServer() as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0)
+        spymaster, guesser = agents.AISpymaster(backend=backend), agents.AIGuesser(backend=backend)
+        prefix = spymaster.get_prefix(a_game.get_spymaster_state())
+        recorder = metrics.start()
+        try:
+            for team in ["BLUE", "RED"]:
+                a_game.play_one_round(guesser, spymaster, override_curr_team=team, verbose=False)
+        finally:
+            metrics.stop()
+    state = a_game.get_spymaster_state()
+    assert spymaster.get_prefix(state) == prefix
+    assert "Unknown" not in spymaster.get_message(state)
+    assert f"Guessed: {a_game.guesses[0]} ({code[a_game.guesses[0]]})" in spymaster.get_message(state)
+    totals = recorder.rollup(by=("role",))
+    # every call after the first of each role reads the system prompt, and the board with code, from the cache
+    assert all(row["cache_read_input_tokens"] > 0 for row in totals)
+
+def test_batch_play():
+    word_list, code = load_default_board()
+    board_fn = lambda seed: (list(word_list), code)
+    with mock_server.MockServer(error_rate=0.1, seed=SEED) as server:
+        backend = batch_play.BatchBackend(base_url=server.url, api_key="test", poll_interval=0.01)
+        results = batch_play.play_games(list(range(20)), backend, board_fn=board_fn)
+        assert server.n_batches == backend.n_batches
+    assert [result["seed"] for result in results] == list(range(20))
+    assert all(result["winner"] in ("BLUE", "RED") for result in results)
+    # one batch per move across all games, retries of errored requests included, instead of one call per move
+    assert backend.n_batches < backend.n_requests / 10
+
+def test_streaming_early_exit():
+    answer = "Tree is closest. <response>Tree</response>" + " Rock was close too." * 20
+    with mock_server.MockServer(responder=[answer], word_delay=0.01) as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0, stop_at=backends.STOP_AT)
+        start = time.perf_counter()
+        found, response, thoughts = agents.get_anthropic_answer(backend, "system", "msg")
+        # the whole answer takes 0.84s to write, but the 80 words after </response> were never waited for
+        assert time.perf_counter() - start < 0.4
+        assert found and response == "Tree"
+        assert thoughts == "Tree is closest. <response>Tree</response>"
+        assert asyncio.run(agents.get_anthropic_answer_async(backend, "system", "msg")) == (found, response, thoughts)
+
+class RankedGuesser(agents.RandomGuesser):
+    """Ranks the given words and counts how often it is asked to guess."""
+    ranks_guesses = True
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self.n_calls = 0
+
+    def get_move(self, state):
+        self.n_calls += 1
+        return super().get_move(state)
+
+    def get_ranked_moves(self, state, n):
+        self.n_calls += 1
+        return [(word, "") for word in self.ranking[:n]]
+
+def test_ranked_guesses():
+    word_list, code = load_default_board()
+    blue = [word for word in word_list if code[word] == "BLUE"]
+    red = [word for word in word_list if code[word] == "RED"]
+    spymaster = agents.AISpymaster(backend=backends.AnthropicBackend(client=FakeClient(answer="<response>Zebra,3</response>")))
+    for ranking, expected in [(blue[:3], (3, None)), ([blue[0], red[0], blue[1]], (2, "handover"))]:
+        a_game = game.Game(list(word_list), code=code, seed=SEED)
+        guesser = RankedGuesser(ranking)
+        assert a_game.play_one_round(guesser, spymaster, override_curr_team="BLUE", verbose=False) == expected
+        # the guesses were played in ranked order from a single call
+        assert guesser.n_calls == 1 and a_game.guesses == tuple(ranking[:expected[0]])
+    # an invalid guess drops the ranking and falls back to asking for one guess
+    a_game = game.Game(list(word_list), code=code, seed=SEED)
+    guesser = RankedGuesser(["Notaword"] + blue)
+    a_game.play_one_round(guesser, spymaster, override_curr_team="BLUE", verbose=False)
+    assert guesser.n_calls >= 2 and a_game.guesses[0] == a_game.words[0]
+    with mock_server.MockServer() as server:
+        backend = backends.AnthropicBackend(base_url=server.url, api_key="test", max_retries=0)
+        async_spymaster = agents.AISpymaster(backend=backends.AnthropicBackend(async_client=FakeAsyncClient(answer="<response>Zebra,3</response>")))
+        a_game = game.Game(list(word_list), code=code, seed=SEED)
+        asyncio.run(a_game.play_one_round_async(agents.AIGuesser(backend=backend, ranked=True), async_spymaster, verbose=False))
+        assert server.n_requests == 1 and a_game.guesses[0] == a_game.words[0]
+
+def test_search_spymaster(tmp_path):
+    rng = np.random.default_rng(SEED)
+    team, opponent, assassin = game.COLOR_IDS["BLUE"], game.COLOR_IDS["RED"], game.COLOR_IDS["ASSASIN"]
+    gained, ended_by = search.simulate_turns(np.array([0.9, 0.8, 0.7]), np.array([team, opponent, team]), team, 3, 5, rng, noise=0.0)
+    assert list(gained) == [1] * 5 and list(ended_by) == [opponent] * 5
+    gained, ended_by = search.simulate_turns(np.array([0.9, 0.1, 0.7]), np.array([team, assassin, team]), team, 3, 5, rng, noise=0.0)
+    assert list(gained) == [2] * 5 and list(ended_by) == [-1] * 5
+
+    word_list, code = load_default_board()
+    code["Pilot"] = "BLUE"
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    local_embeddings = make_embeddings(tmp_path, word_list, code)
+    spymaster = search.SearchSpymaster(local_embeddings, time_budget=0.05, max_workers=2, seed=SEED)
+    assert spymaster.get_move(a_game.get_spymaster_state()) == ("Animal", 4)
+    assert [n for clue, n, _, _ in spymaster.last_search if clue == "Animal"] == [4, 3, 2, 1]
+    proposer = search.LLMProposer(backend=backends.AnthropicBackend(client=FakeClient("<response>Engine,1;Animal,2;Key,1</response>")))
+    spymaster = search.SearchSpymaster(local_embeddings, proposer=proposer, time_budget=0.05, seed=SEED)
+    # Key is on the board so it is never simulated
+    assert spymaster.get_move(a_game.get_spymaster_state()) == ("Animal", 2)
+    assert len(spymaster.last_search) == 2
+
+def test_rules():
+    config = rules.BoardConfig(n_cards=16, n_blue=6, n_red=5, n_assassin=2)
+    code = rules.generate_code([f"Card{i}" for i in range(16)], config)
+    assert [list(code.values()).count(color) for color in rules.COLORS] == [6, 5, 3, 2]
+    a_game = game.Game([f"Card{i}" for i in range(16)], seed=SEED, config=config)
+    assert a_game.play(agents.RandomGuesser(), agents.RandomSpymaster(), max_turns=16) in rules.TEAMS
+    # without a config the standard counts are scaled to the board
+    assert game.Game([f"Card{i}" for i in range(16)], seed=SEED).n_cards == {"BLUE": 6, "RED": 5, "NEUTRAL": 4, "ASSASIN": 1}
+    assert rules.default_config(constants.N_CARDS) == rules.BoardConfig()
+    # a team wins once all of its cards are revealed, whatever the board's counts
+    word_list, code = load_default_board()
+    board = rules.Board(word_list, code)
+    state = rules.new_state(board)
+    blue = [card for card, color in enumerate(board.colors) if color == rules.BLUE]
+    for card in blue[:-1]:
+        assert rules.guess(board, state, card) == rules.BLUE
+    assert rules.guess(board, state, blue[0]) is None
+    assert rules.winner(state, "BLUE", None) is None
+    rules.guess(board, state, blue[-1])
+    assert rules.winner(state, "BLUE", None) == "BLUE" and rules.winner(state, "RED", rules.LOSE) == "BLUE"
+    assert rules.clue_error(board, word_list[0]) is not None and rules.clue_error(board, "Zebra") is None
+
+def test_guesser_out_of_tries_hands_over():
+    class OffBoardGuesser(game.Guesser):
+        def get_move(self, state):
+            return "Notaword", ""
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    assert a_game.play_one_round(OffBoardGuesser(), agents.RandomSpymaster(), verbose=False) == (1, rules.HANDOVER)
+    assert a_game.guesses == ()
+
+def test_game_log(tmp_path):
+    path = str(tmp_path / "games.log")
+    writer = gamelog.Writer(path)
+    games = []
+    for seed in range(3):
+        word_list, code = load_default_board()
+        a_game = game.Game(word_list, code=code, seed=SEED + seed)
+        a_game.verbose = False
+        writer.attach(a_game)
+        a_game.play_rollouts(agents.RandomGuesser(), agents.RandomSpymaster(), 2)
+        a_game.play(agents.RandomGuesser(), agents.RandomSpymaster())
+        games.append(a_game)
+    writer.close()
+    reader = gamelog.Reader(path)
+    assert len(reader) == 3
+    record = reader.game(0)
+    assert (record.events["kind"] == gamelog.ROLLOUT_END).sum() == 2
+    for i, a_game in enumerate(games):
+        replayed = reader.replay(i)
+        assert replayed.words == a_game.words and replayed.guesses == a_game.guesses
+        assert replayed.clues == a_game.clues and replayed.get_score() == a_game.get_score()
+    assert reader.replay(0, turn=1).clues == games[0].clues[:1]
+    stats = reader.stats()
+    assert sum(stats["wins"].values()) == 3
+    assert sum(by_n["clues"] for by_n in stats["clues_by_n"].values()) == sum(len(a_game.clues) for a_game in games)
+    reader.close()
+    # a record cut short by a crash is dropped before more games are appended
+    with open(path, "ab") as f:
+        f.write(gamelog.RECORD_HEADER.pack(gamelog.GAME, 100) + b"abc")
+    writer = gamelog.Writer(path)
+    a_game = game.Game(*load_default_board(), seed=SEED)
+    a_game.verbose = False
+    writer.attach(a_game)
+    a_game.play(agents.RandomGuesser(), agents.RandomSpymaster())
+    writer.close()
+    reader = gamelog.Reader(path)
+    assert len(reader) == 4 and reader.game(3).words == a_game.words
+    # replaying doesn't reseed the random module, which would make every draw after a replay the same
+    draws = []
+    for _ in range(2):
+        reader.replay(3)
+        draws.append(random.random())
+    assert draws[0] != draws[1]
+    reader.close()
+    # a spymaster parsing its count from text gives a string, which the game stores as an int like the log
+    class TextCountSpymaster(game.Spymaster):
+        def get_move(self, state):
+            return "Zebra", "2"
+    writer = gamelog.Writer(path)
+    a_game = game.Game(*load_default_board(), seed=SEED)
+    a_game.verbose = False
+    writer.attach(a_game)
+    a_game.play(agents.RandomGuesser(), TextCountSpymaster(), max_turns=3)
+    writer.close()
+    reader = gamelog.Reader(path)
+    assert reader.replay(4).clues == a_game.clues and a_game.clues[0] == ("Zebra", 2)
+    reader.close()
+    assert a_game.give_clue(("Zebra", "two")) == (False, "Number two is not a whole number. "
+                                                  "Give how many words the clue is for as a whole number.")
+
+def test_speculative_spymaster():
+    class SlowSpymaster(game.Spymaster):
+        def __init__(self):
+            self.seen = []
+        def get_move(self, state):
+            time.sleep(0.1)
+            self.seen.append(tuple(state.guesses))
+            return f"Clue{len(self.seen)}", 1
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    spymaster = SlowSpymaster()
+    speculative = play.SpeculativeSpymaster(agents.RandomGuesser(), spymaster, 1, "RED")
+    speculative.start(a_game)
+    # a human guess changes the board, so the clue is worked out again for the new one
+    a_game.curr_team = "BLUE"
+    blue_word = next(word for word in a_game.words if code[word] == "BLUE")
+    a_game.guess_word([blue_word, ""])
+    speculative.start(a_game)
+    time.sleep(0.5)
+    start = time.perf_counter()
+    speculative.play_round(a_game, verbose=False)
+    assert time.perf_counter() - start < 0.1
+    assert a_game.clues[-1][0] == f"Clue{len(spymaster.seen)}" and spymaster.seen[-1] == (blue_word,)
+    assert len(a_game.rolled_back_results) == 0 and a_game.curr_team == "RED"
+    speculative.close()
+    # a dropped job stops between rollouts instead of playing all of them
+    spymaster = SlowSpymaster()
+    speculative = play.SpeculativeSpymaster(agents.RandomGuesser(), spymaster, 20, "RED", rollout_workers=1)
+    speculative.start(a_game)
+    time.sleep(0.25)
+    speculative.cancel()
+    time.sleep(0.3)
+    n_seen = len(spymaster.seen)
+    time.sleep(0.3)
+    assert len(spymaster.seen) == n_seen < 10
+    speculative.close()
+
+def test_guess_memo():
+    class CountingGuesser(game.Guesser):
+        def __init__(self):
+            self.calls = 0
+        def get_move(self, state):
+            self.calls += 1
+            return sorted(word for word in state.words if word not in state.guesses)[0], "thoughts"
+    class FixedSpymaster(game.Spymaster):
+        def get_move(self, state):
+            return "Clue", 2
+    word_list, code = load_default_board()
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    a_game.guess_memo = game.GuessMemo()
+    guesser = CountingGuesser()
+    results = [a_game.play_one_round(guesser, FixedSpymaster(), rollback=True, verbose=False) for _ in range(3)]
+    n_calls = guesser.calls
+    assert all(rolled_back[1] == a_game.rolled_back_results[0][1] for rolled_back in a_game.rolled_back_results)
+    # the real round replays the rollouts' guesses too
+    assert a_game.play_one_round(guesser, FixedSpymaster(), verbose=False) == results[0]
+    assert guesser.calls == n_calls and len(set(results)) == 1
+    assert a_game.guess_memo.stats()["calls_saved"] == 3 * n_calls
+    # ranked guesses replayed from the memo are recorded as such
+    a_game = game.Game(word_list, code=code, seed=SEED)
+    a_game.verbose = False
+    a_game.guess_memo = game.GuessMemo()
+    a_game.curr_team = "BLUE"
+    guesser = RankedGuesser([word for word in word_list if code[word] == "BLUE"])
+    a_game.play_one_round(guesser, FixedSpymaster(), rollback=True, verbose=False)
+    n_calls = guesser.n_calls
+    recorder = metrics.start()
+    try:
+        a_game.play_one_round(guesser, FixedSpymaster(), verbose=False)
+    finally:
+        metrics.stop()
+    assert guesser.n_calls == n_calls
+    assert [row["memo_moves"] for row in recorder.rollup(by=("role",)) if row["role"] == "guesser"] == [2]
+
+def test_import_budget():
+    seconds, heavy = benchmark.import_seconds(repeats=1)
+    assert heavy == [] and seconds < benchmark.IMPORT_BUDGET_SECONDS
+    # the CLI only needs tkinter to enter a board by hand, and the SDK once a model is called
+    assert benchmark.import_seconds(("play",), repeats=1)[1] == []
+
+def test_profile_games(tmp_path):
+    stats, sampler, recorder = profiling.profile_games(agents.RandomGuesser, agents.RandomSpymaster, range(3),
+                                                       lambda seed: load_default_board(), sample_interval=0.0005)
+    assert {"clue", "guess", "scoring", "rendering"} <= set(recorder.phases)
+    report = profiling.write_profile(stats, sampler, recorder, str(tmp_path / "profile"))
+    assert "get_move" in report
+    stacks = (tmp_path / "profile.collapsed").read_text().splitlines()
+    assert stacks and all(line.rsplit(" ", 1)[1].isdigit() and "game.py:play" in line for line in stacks)
+    # moves are only announced when asked for
+    phases = {verbose: profiling.profile_games(agents.RandomGuesser, agents.RandomSpymaster, range(3),
+                                               lambda seed: load_default_board(), verbose=verbose)[2].phases
+              for verbose in (False, True)}
+    assert phases[False]["rendering"][0] < phases[True]["rendering"][0]
+
 if __name__ == "__main__":
     # test_play_one_round()
     # test_play()
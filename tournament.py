@@ -0,0 +1,163 @@
+"""
+Plays many games between agents across processes and reports win rates.
+
+Each game gets its own seed, which picks the board and the shuffle, so a sweep is reproducible and
+every game starts from fresh state. Results can be streamed to a JSONL file, and rerunning with the
+same file skips the seeds that already finished.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import agents
+import game
+import words
+
+
+def default_board(seed, board_size=25):
+    """Returns (words, code) for a seed. code is None so Game generates it."""
+    return list(words.main(board_size, seed=seed)), None
+
+
+def play_game(guesser_factory, spymaster_factory, seed, board_fn=default_board, max_turns=25):
+    """Plays one game in the current process. Returns a result dict that is written as a JSONL line."""
+    np.random.seed(seed)
+    word_list, code = board_fn(seed)
+    start = time.perf_counter()
+    # the game prints every move, which would flood the terminal from every worker
+    with contextlib.redirect_stdout(io.StringIO()):
+        a_game = game.Game(word_list, code=code, seed=seed)
+        a_game.verbose = False
+        winner = a_game.play(guesser_factory(), spymaster_factory(), max_turns=max_turns)
+    return {"seed": seed, "winner": winner, "turns": a_game.turns, "seconds": time.perf_counter() - start}
+
+
+def wilson_interval(wins, n, z=1.96):
+    """Returns the (low, high) Wilson score interval for a win rate. z=1.96 gives 95% confidence."""
+    if n == 0:
+        return 0.0, 0.0
+    p = wins / n
+    denominator = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def _read_results(results_path):
+    """Returns the finished games in a JSONL file and the length in bytes of the lines they are on.
+    Reading stops at the first line that isn't complete JSON, like one cut short by a crash."""
+    results = []
+    good_length = 0
+    if results_path is None or not os.path.exists(results_path):
+        return results, good_length
+    with open(results_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            good_length += len(line)
+    return results, good_length
+
+
+def load_results(results_path):
+    """Reads finished games from a JSONL file, ignoring a partially written last line."""
+    return _read_results(results_path)[0]
+
+
+def summarize(results, elapsed=None, n_new_games=None):
+    n_games = len(results)
+    wins = {"BLUE": 0, "RED": 0, None: 0}
+    for result in results:
+        wins[result["winner"]] += 1
+    summary = {"n_games": n_games, "wins": wins, "win_rate": {}, "confidence_interval": {}}
+    for team in ["BLUE", "RED"]:
+        summary["win_rate"][team] = wins[team] / n_games if n_games else 0.0
+        summary["confidence_interval"][team] = wilson_interval(wins[team], n_games)
+    if elapsed is not None:
+        summary["games_per_second"] = n_new_games / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def run_tournament(guesser_factory, spymaster_factory, n_boards=100, first_seed=0, seeds=None,
+                   board_fn=default_board, max_workers=None, results_path=None, max_turns=25):
+    """
+    Args:
+        guesser_factory, spymaster_factory: picklable callables returning a new agent, e.g. the agent
+            classes themselves. A fresh pair of agents is built for every game.
+        n_boards: int, number of games, played on seeds first_seed .. first_seed + n_boards - 1.
+        seeds: list of int, if not None, overrides n_boards and first_seed.
+        board_fn: picklable callable taking a seed and returning (words, code).
+        max_workers: int, number of processes. Defaults to the number of cores.
+        results_path: str, JSONL file each finished game is appended to. Seeds already in the file
+            are skipped, so an interrupted sweep can be resumed by rerunning it.
+    Returns:
+        dict with wins, win rates, 95% confidence intervals and games per second over all results.
+    """
+    if seeds is None:
+        seeds = range(first_seed, first_seed + n_boards)
+    previous_results, good_length = _read_results(results_path)
+    if results_path is not None and os.path.exists(results_path):
+        # drop a line cut short by a crash, so new results aren't appended after it
+        os.truncate(results_path, good_length)
+    done_seeds = {result["seed"] for result in previous_results}
+    todo_seeds = [seed for seed in seeds if seed not in done_seeds]
+    seeds = set(seeds)
+    results = [result for result in previous_results if result["seed"] in seeds]
+
+    start = time.perf_counter()
+    results_file = open(results_path, "a", encoding="utf-8") if results_path is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(play_game, guesser_factory, spymaster_factory, seed, board_fn, max_turns)
+                       for seed in todo_seeds]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if results_file is not None:
+                    results_file.write(json.dumps(result) + "\n")
+                    results_file.flush()
+    finally:
+        if results_file is not None:
+            results_file.close()
+    results.sort(key=lambda result: result["seed"])
+    return summarize(results, elapsed=time.perf_counter() - start, n_new_games=len(todo_seeds))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_boards", type=int, default=100)
+    parser.add_argument("--first_seed", type=int, default=0)
+    parser.add_argument("--max_workers", type=int, default=None)
+    parser.add_argument("--results_path", type=str, default=None,
+                        help="JSONL file to stream results to and resume from.")
+    parser.add_argument("--profile", type=str, default=None, metavar="PATH_PREFIX",
+                        help="Play the games in this process under cProfile and a stack sampler instead, and "
+                             "write the hot functions and phase times to PATH_PREFIX.txt and the stacks for a "
+                             "flamegraph to PATH_PREFIX.collapsed.")
+    parser.add_argument("--verbose", action="store_true", help="Print every move, e.g. to profile printing.")
+    args = parser.parse_args()
+    if args.profile is not None:
+        import profiling
+        seeds = range(args.first_seed, args.first_seed + args.n_boards)
+        stats, sampler, recorder = profiling.profile_games(agents.RandomGuesser, agents.RandomSpymaster, seeds,
+                                                           default_board, verbose=args.verbose)
+        print(profiling.write_profile(stats, sampler, recorder, args.profile))
+        return
+    summary = run_tournament(agents.RandomGuesser, agents.RandomSpymaster, n_boards=args.n_boards,
+                             first_seed=args.first_seed, max_workers=args.max_workers,
+                             results_path=args.results_path)
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
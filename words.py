@@ -1,16 +1,56 @@
+import os
+
 import numpy as np
 
-PATH_TO_WORDS = "codenames/wordlist/en-EN/default/wordlist.txt"
+import rules
+
+WORDLIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "codenames", "wordlist")
+PATH_TO_WORDS = os.path.join(WORDLIST_DIR, "en-EN", "default", "wordlist.txt")
+
+_word_lists = {} # path -> deduplicated array of words, loaded on first use
+
+def wordlist_path(language="en-EN", variant="default"):
+    return os.path.join(WORDLIST_DIR, language, variant, "wordlist.txt")
 
-def main(n, seed=None):
-    # Load words
-    with open(PATH_TO_WORDS, "r", encoding="utf-8") as f:
-        words = f.read().split("\n")
-    # get n random words
-    if seed is not None:
-        np.random.seed(seed)
-    chosen_words = np.random.choice(words, n, replace=False)
+def available_wordlists():
+    """Returns the (language, variant) pairs in the codenames submodule."""
+    pairs = []
+    for language in sorted(os.listdir(WORDLIST_DIR)):
+        for variant in sorted(os.listdir(os.path.join(WORDLIST_DIR, language))):
+            if os.path.exists(wordlist_path(language, variant)):
+                pairs.append((language, variant))
+    return pairs
+
+def load_words(path=PATH_TO_WORDS):
+    """Returns the words in a wordlist file, stripped and deduplicated in file order. Each file is
+    only read once per process."""
+    if path not in _word_lists:
+        with open(path, "r", encoding="utf-8") as f:
+            words = [line.strip() for line in f]
+        _word_lists[path] = np.array(list(dict.fromkeys(word for word in words if word)))
+    return _word_lists[path]
+
+def main(n, seed=None, path=PATH_TO_WORDS):
+    # get n random words, without touching the global numpy random state
+    chosen_words = np.random.RandomState(seed).choice(load_words(path), n, replace=False)
     return chosen_words
 
+def sample_boards(n_boards, size=25, seed=None, path=PATH_TO_WORDS, chunk_size=1024):
+    """
+    Yields n_boards (words, code) pairs from a seeded generator. Boards are drawn chunk_size at a
+    time with one vectorized call, and each code is assigned like rules.generate_code.
+    """
+    words = load_words(path)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_boards, chunk_size):
+        n_chunk = min(chunk_size, n_boards - start)
+        # the cards with the size smallest random keys, ordered by key, are a uniform sample
+        keys = rng.random((n_chunk, len(words)))
+        chosen = np.argpartition(keys, size - 1, axis=1)[:, :size]
+        chosen = np.take_along_axis(chosen, np.take_along_axis(keys, chosen, axis=1).argsort(axis=1), axis=1)
+        for board in words[chosen]:
+            board = board.tolist()
+            yield board, rules.generate_code(board)
+
 if __name__ == "__main__":
-    main(25)
\ No newline at end of file
+    main(25)